@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cars.middleware.PerformanceMetricsMiddleware',  # Server-Timing header and /metrics
+    'cars.middleware.ReplicaRoutingMiddleware',  # catalogue GETs to DATABASE_REPLICAS
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
@@ -95,6 +97,13 @@ DATABASES = {
     }
 }
 
+# Read replicas for catalogue reads on GET requests (see cars.routers). Add each
+# one to DATABASES and list its alias here, e.g.
+#   DATABASES['replica'] = {**DATABASES['default'], 'HOST': 'replica.internal'}
+#   DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['cars.routers.ReadReplicaRouter']
+
 #superuser cred: nkeith, 12345
 
 
@@ -152,10 +161,69 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'cars.pagination.PageNumberOrCursorPagination',
     'PAGE_SIZE': 12,
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ]
 }
+
+# Seconds before the in-memory availability index is reloaded from the
+# database. Bookings written through the models by other worker processes
+# are picked up sooner, through the shared booking generation in the cache.
+AVAILABILITY_INDEX_TTL = 300
+
+# Seconds a cached /api/cars/facets/ response may be served. Entries are also
+# dropped as soon as the catalogue (or, for date searches, a booking) changes.
+CAR_FACETS_CACHE_TIMEOUT = 300
+
+# Largest number of operations accepted by /api/bookings/batch/
+BOOKING_BATCH_MAX_SIZE = 500
+
+# Threads rendering CarImage thumbnails in the background after an upload
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Rows fetched per round trip while streaming /api/exports/ and export_data
+EXPORT_CHUNK_SIZE = 2000
+
+# Addresses allowed to read /metrics; an empty list allows everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Seconds a client keeps reading from the primary after one of its writes
+REPLICA_STICKY_SECONDS = 10
+
+# Seconds a car's cached booking calendar may be served. Entries are also
+# dropped as soon as one of that car's bookings changes.
+CAR_CALENDAR_CACHE_TIMEOUT = 3600
+
+# Longest range, in days, one /api/cars/calendar/ request may cover
+CAR_CALENDAR_MAX_DAYS = 731
+
+# Seconds before the in-memory similar-cars index is rebuilt, so car changes
+# made by other worker processes are picked up.
+SIMILARITY_INDEX_TTL = 300
+
+# Default and largest number of cars returned by /api/cars/{id}/similar/
+SIMILAR_CARS_DEFAULT = 6
+SIMILAR_CARS_MAX = 24
+
+# Seconds a car's cached rating histogram may be served. Entries are also
+# dropped as soon as one of that car's reviews changes.
+REVIEW_HISTOGRAM_CACHE_TIMEOUT = 3600
+
+# Largest number of bookings per group on /api/bookings/dashboard/
+BOOKING_DASHBOARD_MAX_LIMIT = 50
+
+# Rows above which admin changelists show PostgreSQL's row estimate
+# instead of running an exact COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = 100000
+
+# Cached facets, calendars and rating histograms are invalidated through
+# generation keys in the default cache. With more than one worker process,
+# point CACHES at a shared backend such as Redis or Memcached so every
+# worker sees the same generations, e.g.
+#   CACHES = {'default': {
+#       'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#       'LOCATION': 'redis://127.0.0.1:6379',
+#   }}
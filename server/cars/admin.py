@@ -1,6 +1,84 @@
+import json
+import logging
+from functools import cached_property
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+
+from .metrics import current_timings
 from .models import Car, CarCategory, CarFeature, CarImage, Booking, Review
 
+logger = logging.getLogger(__name__)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the planner's row estimate for large results on PostgreSQL.
+
+    An exact COUNT(*) over millions of rows can take seconds. When EXPLAIN
+    expects more than ADMIN_EXACT_COUNT_LIMIT rows, the estimate is used for
+    the result count and page links. Smaller results, and other databases,
+    are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = self.estimated_count(queryset)
+            if estimate is not None and estimate > getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimated_count(queryset):
+        """The planner's row estimate for `queryset`, or None if it can't be read"""
+        try:
+            plan = json.loads(queryset.explain(format='json'))
+            # psycopg decodes the JSON column, so Django returns the plan object itself
+            plan = plan[0] if isinstance(plan, list) else plan
+            return int(plan['Plan']['Plan Rows'])
+        except (ValueError, TypeError, KeyError, IndexError):
+            return None
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow without bound.
+
+    Counts are estimated, the unfiltered total is not counted again, and a
+    changelist making more than `changelist_query_budget` queries is logged
+    (with PerformanceMetricsMiddleware installed), which usually means a
+    column is missing from `list_select_related`.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    changelist_query_budget = 8
+    # Treat an all-digit search term as a primary key instead of searching
+    search_by_id = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.search_by_id and search_term.strip().isdigit():
+            return queryset.filter(pk=int(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def changelist_view(self, request, extra_context=None):
+        timings = current_timings()
+        response = super().changelist_view(request, extra_context)
+        if timings is None or not hasattr(response, 'add_post_render_callback'):
+            return response
+        queries_before_render = timings.queries
+
+        def check_budget(response):
+            if timings.queries > self.changelist_query_budget:
+                logger.warning(
+                    '%s changelist made %d queries (%d while rendering), budget %d',
+                    self.model._meta.label, timings.queries,
+                    timings.queries - queries_before_render, self.changelist_query_budget,
+                )
+
+        response.add_post_render_callback(check_budget)
+        return response
+
 @admin.register(CarCategory)
 class CarCategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
@@ -16,21 +94,36 @@ class CarImageInline(admin.TabularInline):
     extra = 1
 
 @admin.register(Car)
-class CarAdmin(admin.ModelAdmin):
+class CarAdmin(LargeTableAdmin):
     list_display = ('make', 'model', 'year', 'category', 'daily_rate', 'is_available')
-    list_filter = ('is_available', 'category', 'make', 'transmission', 'fuel_type')
+    list_select_related = ('category',)
+    list_filter = ('is_available', 'category', 'transmission', 'fuel_type')
     search_fields = ('make', 'model', 'license_plate')
+    autocomplete_fields = ('category',)
+    # Stable pages for the booking and review car autocompletes
+    ordering = ('id',)
     inlines = [CarImageInline]
     filter_horizontal = ('features',)
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
-    list_display = ('user', 'car', 'start_date', 'end_date', 'status', 'total_cost')
-    list_filter = ('status', 'start_date')
-    search_fields = ('user__username', 'car__make', 'car__model')
+class BookingAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'car', 'start_date', 'end_date', 'status', 'total_cost')
+    list_select_related = ('user', 'car')
+    list_filter = ('status',)
+    date_hierarchy = 'start_date'
+    # Exact matches only, each served by a unique index
+    search_fields = ('user__username__exact', 'car__license_plate__exact')
+    search_help_text = 'Exact username or license plate, or a booking id'
+    search_by_id = True
+    autocomplete_fields = ('user', 'car')
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('user', 'car', 'rating', 'created_at')
-    list_filter = ('rating', 'created_at')
-    search_fields = ('user__username', 'car__make', 'car__model')
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'car', 'rating', 'created_at')
+    list_select_related = ('user', 'car')
+    list_filter = ('rating',)
+    date_hierarchy = 'created_at'
+    search_fields = ('user__username__exact', 'car__license_plate__exact')
+    search_help_text = 'Exact username or license plate, or a review id'
+    search_by_id = True
+    autocomplete_fields = ('user', 'car')
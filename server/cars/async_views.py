@@ -0,0 +1,121 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import filters, status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .availability import availability_index
+from .filters import CarAvailabilityFilter, CarFacetFilter, parse_date_range
+from .models import Car, CarCategory, CarFeature
+from .pagination import PageNumberOrCursorPagination
+from .search import CarSearchFilter
+from .serializers import CarCategorySerializer, CarFeatureSerializer, CarListSerializer, CarSerializer
+
+
+class AsyncReadView(View):
+    """Read-only list / detail endpoint served with the async ORM.
+
+    Mirrors the GET side of the matching viewset (same serializers, filters,
+    pagination and response shape) for deployments running under ASGI, where
+    a request waiting on the database does not hold a worker thread.
+    """
+    http_method_names = ['get', 'head', 'options']
+    queryset = None
+    serializer_class = None
+    list_serializer_class = None
+    filter_backends = ()
+    pagination_class = PageNumberOrCursorPagination
+
+    async def get(self, request, pk=None, action=None):
+        request = Request(request)
+        try:
+            if action is not None:
+                data = await getattr(self, action)(request, pk)
+            elif pk is None:
+                data = await self.list(request)
+            else:
+                data = await self.retrieve(request, pk)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            return self.render(detail, exc.status_code)
+        return self.render(data)
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+    def get_serializer_class(self, many=False):
+        if many and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return self.serializer_class
+
+    def get_serializer(self, *args, many=False, request=None, **kwargs):
+        return self.get_serializer_class(many)(*args, many=many, context={'request': request}, **kwargs)
+
+    def get_queryset(self, request, many=False):
+        # Only join and prefetch the relations the response will render
+        serializer = self.get_serializer_class(many)(context={'request': request})
+        return serializer.optimize_queryset(self.queryset.all())
+
+    def filter_queryset(self, request, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    async def list(self, request):
+        # Filters may consult the availability index, which can reload from the database
+        queryset = await sync_to_async(self.filter_queryset)(request, self.get_queryset(request, many=True))
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(queryset, request, self)
+        if rows is None:
+            return self.get_serializer([row async for row in queryset], many=True, request=request).data
+        return paginator.get_paginated_response(self.get_serializer(rows, many=True, request=request).data).data
+
+    async def retrieve(self, request, pk):
+        instance = await self.get_object(request, pk)
+        return self.get_serializer(instance, request=request).data
+
+    async def get_object(self, request, pk, queryset=None):
+        queryset = self.get_queryset(request) if queryset is None else queryset
+        instance = await queryset.filter(pk=pk).afirst()
+        if instance is None:
+            raise NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+        return instance
+
+
+class AsyncCarView(AsyncReadView):
+    queryset = Car.objects.all()
+    serializer_class = CarSerializer
+    list_serializer_class = CarListSerializer
+    filter_backends = (CarSearchFilter, CarFacetFilter, CarAvailabilityFilter, filters.OrderingFilter)
+    search_fields = ['make', 'model', 'year', 'transmission', 'fuel_type', 'category__name']
+    ordering_fields = ['daily_rate', 'year']
+    cursor_ordering_fields = ['daily_rate', 'year']
+
+    async def statistics(self, request, pk):
+        car = await self.get_object(request, pk, queryset=Car.objects.all())
+        return {
+            'average_rating': car.average_rating,
+            'total_bookings': car.total_bookings
+        }
+
+    async def available(self, request, pk=None):
+        date_range = parse_date_range(request)
+        if date_range is None:
+            raise ValidationError({"error": "Please provide start_date and end_date parameters"})
+        unavailable_cars = await sync_to_async(availability_index.unavailable_car_ids)(*date_range)
+        queryset = self.get_queryset(request, many=True).exclude(id__in=unavailable_cars)
+        return self.get_serializer([car async for car in queryset], many=True, request=request).data
+
+
+class AsyncCategoryView(AsyncReadView):
+    queryset = CarCategory.objects.all()
+    serializer_class = CarCategorySerializer
+
+
+class AsyncFeatureView(AsyncReadView):
+    queryset = CarFeature.objects.all()
+    serializer_class = CarFeatureSerializer
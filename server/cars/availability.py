@@ -0,0 +1,231 @@
+import threading
+import time
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, F, Field, Func, Value
+
+from .generations import BOOKING_GENERATION_KEY, bump_generation, current_generations
+from .models import Booking
+
+# Booking statuses that block a car for their date range
+ACTIVE_STATUSES = ('P', 'C', 'A')
+
+
+class DateRange(Func):
+    """PostgreSQL daterange(start, end, '[]'): an inclusive date range"""
+    function = 'daterange'
+    template = "%(function)s(%(expressions)s, '[]')"
+    output_field = Field()
+
+
+class RangesOverlap(Func):
+    """PostgreSQL `range && range`"""
+    template = '(%(expressions)s)'
+    arg_joiner = ' && '
+    output_field = BooleanField()
+
+
+def active_bookings_overlapping(start_date, end_date, queryset=None):
+    """Active bookings intersecting start_date..end_date, both inclusive.
+
+    On PostgreSQL the test is `daterange(start_date, end_date, '[]') && ...`,
+    the expression indexed by the GiST exclusion constraint from migration
+    0008. Other databases compare the two dates, using that migration's
+    composite B-tree indexes.
+    """
+    queryset = Booking.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(status__in=ACTIVE_STATUSES)
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(RangesOverlap(
+            DateRange(F('start_date'), F('end_date')),
+            DateRange(Value(start_date), Value(end_date)),
+        ))
+    return queryset.filter(start_date__lte=end_date, end_date__gte=start_date)
+
+
+class CarIntervals:
+    """Sorted, inclusive date intervals of the active bookings for one car.
+
+    ``starts`` is kept sorted and ``max_ends[i]`` holds the latest end date of
+    the first ``i + 1`` intervals, so an overlap test is a single bisect.
+    """
+
+    __slots__ = ('starts', 'ends', 'booking_ids', 'max_ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.booking_ids = []
+        self.max_ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, booking_id, start_date, end_date):
+        i = bisect_right(self.starts, start_date)
+        self.starts.insert(i, start_date)
+        self.ends.insert(i, end_date)
+        self.booking_ids.insert(i, booking_id)
+        self.max_ends.insert(i, end_date)
+        self._refresh_max_ends(i)
+
+    def remove(self, booking_id):
+        try:
+            i = self.booking_ids.index(booking_id)
+        except ValueError:
+            return False
+        del self.starts[i], self.ends[i], self.booking_ids[i], self.max_ends[i]
+        self._refresh_max_ends(i)
+        return True
+
+    def overlaps(self, start_date, end_date):
+        """Return True if any interval intersects [start_date, end_date]."""
+        i = bisect_right(self.starts, end_date)
+        return i > 0 and self.max_ends[i - 1] >= start_date
+
+    def _refresh_max_ends(self, i):
+        running = self.max_ends[i - 1] if i > 0 else None
+        for j in range(i, len(self.ends)):
+            end = self.ends[j]
+            running = end if running is None or end > running else running
+            self.max_ends[j] = running
+
+
+class AvailabilityIndex:
+    """Process-local index of active bookings, keyed by car id.
+
+    The index is loaded from the database on first use and then kept current
+    by the ``Booking`` signal handlers in ``cars.signals``. It remembers the
+    shared ``BOOKING_GENERATION_KEY`` it was built at and is rebuilt when
+    another process has bumped it since. Writes that bump nothing (e.g.
+    ``QuerySet.update``) are picked up after ``AVAILABILITY_INDEX_TTL`` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Serializes rebuilds without blocking readers of the current index
+        self._rebuild_lock = threading.Lock()
+        self._cars = {}
+        self._booking_cars = {}
+        self._built_at = None
+        self._generation = None
+
+    def rebuild(self):
+        """Reload every active booking from the database."""
+        # Read first, so a write committed during the query forces another rebuild
+        generation = current_generations([BOOKING_GENERATION_KEY])[BOOKING_GENERATION_KEY]
+        bookings = (
+            Booking.objects
+            .filter(status__in=ACTIVE_STATUSES)
+            .order_by('car_id', 'start_date')
+            .values_list('id', 'car_id', 'start_date', 'end_date')
+        )
+        cars = {}
+        booking_cars = {}
+        for booking_id, car_id, start_date, end_date in bookings.iterator(chunk_size=2000):
+            intervals = cars.get(car_id)
+            if intervals is None:
+                intervals = cars[car_id] = CarIntervals()
+            intervals.add(booking_id, start_date, end_date)
+            booking_cars[booking_id] = car_id
+        with self._lock:
+            self._cars = cars
+            self._booking_cars = booking_cars
+            self._built_at = time.monotonic()
+            self._generation = generation
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def is_stale(self):
+        ttl = getattr(settings, 'AVAILABILITY_INDEX_TTL', 300)
+        with self._lock:
+            if self._built_at is None or (ttl is not None and time.monotonic() - self._built_at > ttl):
+                return True
+            generation = self._generation
+        return current_generations([BOOKING_GENERATION_KEY])[BOOKING_GENERATION_KEY] != generation
+
+    def ensure_loaded(self):
+        if not self.is_stale():
+            return
+        with self._rebuild_lock:
+            # Another thread may have rebuilt it while this one waited
+            if self.is_stale():
+                self.rebuild()
+
+    def bookings_written(self, updates=(), deleted=()):
+        """Apply committed booking writes of this process and bump BOOKING_GENERATION_KEY.
+
+        `updates` holds (booking_id, car_id, start_date, end_date, status)
+        tuples and `deleted` booking ids. The index takes over the new
+        generation only when it came straight from the one it is at, so a
+        bump by another process in between still causes a rebuild. The lock
+        is held throughout so a concurrent rebuild cannot swap in an index
+        that misses these writes under the new generation.
+        """
+        with self._lock:
+            for values in updates:
+                self.update(*values)
+            for booking_id in deleted:
+                self.discard(booking_id)
+            generation = bump_generation(BOOKING_GENERATION_KEY)
+            if self._generation is not None and generation == self._generation + 1:
+                self._generation = generation
+
+    def update(self, booking_id, car_id, start_date, end_date, status):
+        """Apply a saved booking, adding or dropping its interval."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._discard(booking_id)
+            if status in ACTIVE_STATUSES:
+                intervals = self._cars.get(car_id)
+                if intervals is None:
+                    intervals = self._cars[car_id] = CarIntervals()
+                intervals.add(booking_id, start_date, end_date)
+                self._booking_cars[booking_id] = car_id
+
+    def discard(self, booking_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._discard(booking_id)
+
+    def _discard(self, booking_id):
+        car_id = self._booking_cars.pop(booking_id, None)
+        if car_id is None:
+            return
+        intervals = self._cars[car_id]
+        intervals.remove(booking_id)
+        if not intervals:
+            del self._cars[car_id]
+
+    def is_available(self, car_id, start_date, end_date):
+        self.ensure_loaded()
+        with self._lock:
+            intervals = self._cars.get(car_id)
+            return intervals is None or not intervals.overlaps(start_date, end_date)
+
+    def unavailable_car_ids(self, start_date, end_date):
+        """Return the ids of cars with an active booking overlapping the range."""
+        self.ensure_loaded()
+        with self._lock:
+            return {
+                car_id for car_id, intervals in self._cars.items()
+                if intervals.overlaps(start_date, end_date)
+            }
+
+    def verify(self, start_date, end_date):
+        """Compare the index against SQL for a date range.
+
+        Returns a tuple ``(missing, extra)``: car ids the database reports as
+        booked but the index does not, and the other way round.
+        """
+        expected = set(active_bookings_overlapping(start_date, end_date).values_list('car_id', flat=True))
+        actual = self.unavailable_car_ids(start_date, end_date)
+        return expected - actual, actual - expected
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,263 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .availability import ACTIVE_STATUSES, active_bookings_overlapping
+from .models import BOOKING_STATUS_COUNTERS, Booking, Car, adjust_car_counters, move_booking_rollups
+from .pricing import booking_total, cents_to_decimal, quote_totals
+from .signals import bookings_written
+
+
+class BookingConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = {"error": "This car is already booked for some of these dates"}
+    default_code = 'booking_conflict'
+
+
+def overlapping_bookings(car_id, start_date, end_date):
+    return active_bookings_overlapping(start_date, end_date, Booking.objects.filter(car_id=car_id))
+
+
+def create_booking(user, car_id, start_date, end_date):
+    """Create a pending booking, refusing dates that overlap an active booking.
+
+    The car row is locked for the length of the check and insert, so two
+    requests for the same car are serialized while bookings for other cars
+    go ahead in parallel.
+    """
+    with transaction.atomic():
+        car = Car.objects.select_for_update().filter(pk=car_id).first()
+        if car is None:
+            raise ValidationError({"car_id": ["Car not found"]})
+        if overlapping_bookings(car.pk, start_date, end_date).exists():
+            raise BookingConflict()
+
+        try:
+            with transaction.atomic():
+                return Booking.objects.create(
+                    user=user,
+                    car=car,
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_cost=booking_total(car, start_date, end_date),
+                    status='P'  # Default status is Pending
+                )
+        except IntegrityError:
+            # The exclusion constraint on PostgreSQL caught an overlap the check above missed
+            raise BookingConflict()
+
+
+def change_booking_dates(booking, start_date, end_date):
+    """Move a pending or confirmed booking to new dates and reprice it.
+
+    Overlaps are refused the same way as in create_booking, with the car
+    row locked for the check and the update.
+    """
+    if booking.status not in ('P', 'C'):
+        raise ValidationError({"error": "Cannot change the dates of this booking"})
+    with transaction.atomic():
+        car = Car.objects.select_for_update().get(pk=booking.car_id)
+        if overlapping_bookings(car.pk, start_date, end_date).exclude(pk=booking.pk).exists():
+            raise BookingConflict()
+        booking.start_date = start_date
+        booking.end_date = end_date
+        booking.total_cost = booking_total(car, start_date, end_date)
+        try:
+            with transaction.atomic():
+                booking.save(update_fields=['start_date', 'end_date', 'total_cost', 'updated_at'])
+        except IntegrityError:
+            # The exclusion constraint on PostgreSQL caught an overlap the check above missed
+            raise BookingConflict()
+    return booking
+
+
+def booking_result(index, booking):
+    return {
+        'index': index,
+        'ok': True,
+        'id': booking.pk,
+        'car_id': booking.car_id,
+        'start_date': booking.start_date,
+        'end_date': booking.end_date,
+        'total_cost': str(booking.total_cost),
+        'status': booking.status,
+    }
+
+
+def error_result(index, message):
+    return {'index': index, 'ok': False, 'error': message}
+
+
+def overlaps(intervals, start_date, end_date):
+    return any(start <= end_date and end >= start_date for start, end in intervals)
+
+
+def apply_booking_batch(user, operations):
+    """Apply many create / cancel / status operations in one transaction.
+
+    `operations` is a list of (index, data) pairs validated by
+    BookingOperationSerializer. The same rules as the single-booking endpoints
+    apply per item; items that break one get an error result and the rest
+    are still written with bulk_create / bulk_update. Returns a dict mapping
+    each index to its result.
+    """
+    creates = [(index, data) for index, data in operations if data['op'] == 'create']
+    changes = [(index, data) for index, data in operations if data['op'] != 'create']
+    results = {}
+    deltas = defaultdict(Counter)
+    with transaction.atomic():
+        car_ids = {data['car_id'] for _, data in creates}
+        if changes:
+            car_ids.update(
+                Booking.objects.filter(pk__in={data['id'] for _, data in changes}).values_list('car_id', flat=True)
+            )
+        # Lock every car involved, in id order so concurrent batches cannot deadlock
+        cars = Car.objects.select_for_update().filter(pk__in=car_ids).order_by('pk').in_bulk()
+        created = _batch_create(user, creates, cars, results, deltas)
+        changed = _batch_change(user, changes, results, deltas)
+        for car_id, counts in deltas.items():
+            adjust_car_counters(car_id, **{BOOKING_STATUS_COUNTERS[status]: delta for status, delta in counts.items()})
+        bookings_written(created + changed)
+    return results
+
+
+def _batch_create(user, operations, cars, results, deltas):
+    if not operations:
+        return []
+    car_ids = sorted({data['car_id'] for _, data in operations})
+    booked = defaultdict(list)
+    for car_id, start, end in overlapping_bookings_window(
+        car_ids,
+        min(data['start_date'] for _, data in operations),
+        max(data['end_date'] for _, data in operations),
+    ):
+        booked[car_id].append((start, end))
+
+    pending = []
+    for index, data in operations:
+        car = cars.get(data['car_id'])
+        start_date, end_date = data['start_date'], data['end_date']
+        if car is None:
+            results[index] = error_result(index, "Car not found")
+        elif overlaps(booked[car.pk], start_date, end_date):
+            results[index] = error_result(index, BookingConflict.default_detail['error'])
+        else:
+            # Later items in the same batch must not overlap this one either
+            booked[car.pk].append((start_date, end_date))
+            pending.append((index, Booking(
+                user=user, car=car, start_date=start_date, end_date=end_date, status='P',
+            )))
+
+    if pending:
+        bookings = [booking for _, booking in pending]
+        totals = quote_totals(
+            [booking.car.daily_rate for booking in bookings],
+            [booking.car.weekend_rate for booking in bookings],
+            [booking.start_date for booking in bookings],
+            [booking.end_date for booking in bookings],
+        )
+        for booking, cents in zip(bookings, totals):
+            booking.total_cost = cents_to_decimal(cents)
+
+    created = Booking.objects.bulk_create([booking for _, booking in pending])
+    for (index, _), booking in zip(pending, created):
+        results[index] = booking_result(index, booking)
+        deltas[booking.car_id]['P'] += 1
+    return created
+
+
+def overlapping_bookings_window(car_ids, start_date, end_date):
+    return active_bookings_overlapping(
+        start_date, end_date, Booking.objects.filter(car_id__in=car_ids)
+    ).values_list('car_id', 'start_date', 'end_date')
+
+
+def _batch_change(user, operations, results, deltas):
+    if not operations:
+        return []
+    bookings = Booking.objects.select_for_update().filter(pk__in={data['id'] for _, data in operations})
+    if not user.is_staff:
+        bookings = bookings.filter(user=user)
+    bookings = bookings.in_bulk()
+    original = {pk: booking.status for pk, booking in bookings.items()}
+    now = timezone.now()
+
+    # Dates of the bookings this batch makes active again, by car
+    reactivating = defaultdict(list)
+    changed = {}
+    indexes = defaultdict(list)
+    for index, data in operations:
+        booking = bookings.get(data['id'])
+        if booking is None:
+            results[index] = error_result(index, "Booking not found")
+            continue
+        if data['op'] == 'cancel':
+            if booking.status not in ['P', 'C']:  # Can only cancel Pending or Confirmed bookings
+                results[index] = error_result(index, "Cannot cancel this booking")
+                continue
+            new_status = 'CA'
+        else:
+            if not user.is_staff:
+                results[index] = error_result(index, "Only staff can change a booking's status")
+                continue
+            new_status = data['status']
+            reactivated = new_status in ACTIVE_STATUSES and booking.status not in ACTIVE_STATUSES
+            if reactivated:
+                if overlaps(reactivating[booking.car_id], booking.start_date, booking.end_date) or overlapping_bookings(
+                    booking.car_id, booking.start_date, booking.end_date
+                ).exclude(pk=booking.pk).exists():
+                    results[index] = error_result(index, BookingConflict.default_detail['error'])
+                    continue
+                # Later items in the same batch must not overlap this one either
+                reactivating[booking.car_id].append((booking.start_date, booking.end_date))
+        booking.status = new_status
+        booking.updated_at = now
+        changed[booking.pk] = booking
+        indexes[booking.pk].append(index)
+        results[index] = booking_result(index, booking)
+
+    try:
+        with transaction.atomic():
+            Booking.objects.bulk_update(changed.values(), ['status', 'updated_at'])
+    except IntegrityError:
+        # The exclusion constraint on PostgreSQL caught an overlap the checks above
+        # missed; write the bookings one by one to find the conflicting items
+        for pk, booking in list(changed.items()):
+            try:
+                with transaction.atomic():
+                    Booking.objects.filter(pk=pk).update(status=booking.status, updated_at=now)
+            except IntegrityError:
+                booking.status = original[pk]
+                del changed[pk]
+                for index in indexes[pk]:
+                    results[index] = error_result(index, BookingConflict.default_detail['error'])
+    for booking in changed.values():
+        if booking.status != original[booking.pk]:
+            deltas[booking.car_id][original[booking.pk]] -= 1
+            deltas[booking.car_id][booking.status] += 1
+            move_booking_rollups(booking._rolled_up, booking.rollup_state())
+            booking._rolled_up = booking.rollup_state()
+    return list(changed.values())
+
+
+def dashboard_groups(today):
+    """(filter, ordering) of the upcoming, active and past groups of a user's dashboard"""
+    return {
+        'active': (
+            Q(status='A') | Q(status__in=('P', 'C'), start_date__lte=today, end_date__gte=today),
+            'start_date',
+        ),
+        'upcoming': (Q(status__in=('P', 'C'), start_date__gt=today), 'start_date'),
+        'past': (Q(status__in=('CO', 'CA')) | Q(status__in=('P', 'C'), end_date__lt=today), '-start_date'),
+    }
+
+
+def status_counts(bookings):
+    """Number of bookings per status code, in one aggregate query"""
+    return bookings.aggregate(**{
+        status: Count('pk', filter=Q(status=status)) for status in BOOKING_STATUS_COUNTERS
+    })
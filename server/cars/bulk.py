@@ -0,0 +1,81 @@
+from io import StringIO
+from itertools import islice
+
+from django.db import connection
+
+from .availability import availability_index
+from .calendar import CALENDAR_GENERATION_KEY
+from .generations import BOOKING_GENERATION_KEY, CATALOGUE_GENERATION_KEY, bump_generation
+from .models import Car
+from .search import update_search_vectors
+from .similarity import similarity_index
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def copy_value(value):
+    """Encode one value for COPY's text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def insert_rows(model, fields, rows):
+    """Insert plain tuples into `model`'s table without building instances.
+
+    Uses COPY on PostgreSQL and a single executemany elsewhere. Values are
+    written as given: no save(), signals, auto_now or counter updates, so
+    callers refresh anything derived afterwards. Returns the row count.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in model_fields)
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            sql = f'COPY {table} ({columns}) FROM STDIN'
+            if hasattr(cursor.cursor, 'copy'):  # psycopg 3
+                with cursor.cursor.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:  # psycopg2
+                buffer = StringIO(''.join(
+                    '\t'.join(copy_value(value) for value in row) + '\n' for row in rows
+                ))
+                cursor.cursor.copy_expert(sql, buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(model_fields))
+            # The wrapper itself, skipping the thread-local lookup behind `connection` per value
+            db = cursor.db
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+                [
+                    [field.get_db_prep_value(value, db) for field, value in zip(model_fields, row)]
+                    for row in rows
+                ],
+            )
+    return len(rows)
+
+
+def refresh_derived_data():
+    """Rebuild everything signals would have kept up to date after a bulk load."""
+    Car.objects.update(**Car.counter_expressions())
+    update_search_vectors()
+    availability_index.invalidate()
+    similarity_index.invalidate()
+    bump_generation(CATALOGUE_GENERATION_KEY)
+    bump_generation(BOOKING_GENERATION_KEY)
+    bump_generation(CALENDAR_GENERATION_KEY)
@@ -0,0 +1,96 @@
+import base64
+import hashlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+
+from .availability import active_bookings_overlapping
+from .generations import bump_generation, current_generations
+from .models import Booking
+
+CALENDAR_ENCODINGS = ('bitmap', 'runs')
+
+# Bumped after bulk loads, which bypass the per-car invalidation in cars.signals
+CALENDAR_GENERATION_KEY = 'cars:calendar'
+
+
+def car_generation_key(car_id):
+    return f'cars:calendar:{car_id}'
+
+
+def calendars_changed(car_ids):
+    """Invalidate the cached calendars of these cars."""
+    for car_id in set(car_ids):
+        bump_generation(car_generation_key(car_id))
+
+
+def parse_calendar_params(request):
+    """Return (first_day, last_day, encoding) from `from`, `to` and `encoding`.
+
+    Without `from` the calendar starts today; without `to` it runs for a year.
+    """
+    try:
+        first_day = request.query_params.get('from')
+        first_day = datetime.strptime(first_day, '%Y-%m-%d').date() if first_day else date.today()
+        last_day = request.query_params.get('to')
+        last_day = datetime.strptime(last_day, '%Y-%m-%d').date() if last_day else first_day + timedelta(days=364)
+    except ValueError:
+        raise ValidationError({"error": "Invalid date format. Use YYYY-MM-DD"})
+    if last_day < first_day:
+        raise ValidationError({"error": "to cannot be before from"})
+    max_days = getattr(settings, 'CAR_CALENDAR_MAX_DAYS', 731)
+    if (last_day - first_day).days + 1 > max_days:
+        raise ValidationError({"error": f"A calendar can cover at most {max_days} days"})
+    encoding = request.query_params.get('encoding', 'bitmap')
+    if encoding not in CALENDAR_ENCODINGS:
+        raise ValidationError({"error": f"encoding must be one of: {', '.join(CALENDAR_ENCODINGS)}"})
+    return first_day, last_day, encoding
+
+
+def occupancy(bookings, first_day, days):
+    """Boolean array with one entry per day from first_day, True where booked"""
+    booked = np.zeros(days, dtype=bool)
+    for start_date, end_date in bookings:
+        booked[max((start_date - first_day).days, 0):(end_date - first_day).days + 1] = True
+    return booked
+
+
+def encode_bitmap(booked):
+    # Day i is bit 7 - i % 8 of byte i // 8, most significant bit first
+    return base64.b64encode(np.packbits(booked).tobytes()).decode('ascii')
+
+
+def encode_runs(booked):
+    """[[offset, length], ...] for each run of booked days, offsets from the first day"""
+    edges = np.flatnonzero(np.diff(booked.astype(np.int8), prepend=0, append=0))
+    return [[int(start), int(end - start)] for start, end in zip(edges[0::2], edges[1::2])]
+
+
+def car_calendars(car_ids, first_day, last_day, encoding):
+    """Encoded occupancy of each car over first_day..last_day, {car_id: value}.
+
+    The calendars of one call are cached together, under a key made from
+    every car's generation, so they are dropped when a booking of any of
+    the cars is written. A miss is built from a single bookings query.
+    """
+    generations = current_generations([CALENDAR_GENERATION_KEY, *map(car_generation_key, car_ids)])
+    versions = [(car_id, generations[car_generation_key(car_id)]) for car_id in car_ids]
+    fingerprint = repr((generations[CALENDAR_GENERATION_KEY], versions, first_day, last_day, encoding))
+    key = f'cars:calendar:{hashlib.md5(fingerprint.encode()).hexdigest()}'
+    calendars = cache.get(key)
+    if calendars is None:
+        bookings = {car_id: [] for car_id in car_ids}
+        rows = active_bookings_overlapping(
+            first_day, last_day, Booking.objects.filter(car_id__in=car_ids)
+        ).values_list('car_id', 'start_date', 'end_date')
+        for car_id, start_date, end_date in rows:
+            bookings[car_id].append((start_date, end_date))
+
+        days = (last_day - first_day).days + 1
+        encode = encode_bitmap if encoding == 'bitmap' else encode_runs
+        calendars = {car_id: encode(occupancy(bookings[car_id], first_day, days)) for car_id in car_ids}
+        cache.set(key, calendars, getattr(settings, 'CAR_CALENDAR_CACHE_TIMEOUT', 3600))
+    return calendars
@@ -0,0 +1,61 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def table_state(queryset):
+    """Latest `updated_at` and row count of a queryset, in one aggregate query."""
+    return queryset.aggregate(updated=Max('updated_at'), count=Count('pk'))
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match / If-Modified-Since on reads with 304 before serializing.
+
+    Single objects get an ETag and Last-Modified, collections only an ETag.
+    Validators come from `get_conditional_state`, a list of `table_state`-style
+    dicts describing every table the response is built from. The ETag also
+    covers the full path and Accept header, since those change the body.
+    """
+    conditional_actions = ('list', 'retrieve')
+    # Deleting a row can leave a collection's Max(updated_at) unchanged, so
+    # collections are validated by their ETag (which counts rows) alone
+    last_modified_actions = ('retrieve',)
+
+    def get_conditional_state(self):
+        model = self.queryset.model
+        if self.action == 'retrieve':
+            return [table_state(model.objects.filter(pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field]))]
+        return [table_state(model.objects.all())]
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        try:
+            state = self.get_conditional_state()
+        except (TypeError, ValueError):
+            # Malformed lookups are left for the handler to reject
+            return handler(request, *args, **kwargs)
+
+        timestamps = [part['updated'] for part in state if part['updated'] is not None]
+        last_modified = None
+        if timestamps and self.action in self.last_modified_actions:
+            last_modified = int(max(timestamps).timestamp())
+        fingerprint = repr((state, request.get_full_path(), request.META.get('HTTP_ACCEPT')))
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,130 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import ValidationError
+
+from .models import Booking, Car, Review
+
+# Flat column name -> ORM lookup, per export
+EXPORTS = {
+    'bookings': {
+        'model': Booking,
+        'columns': {
+            'id': 'id',
+            'user_id': 'user_id',
+            'username': 'user__username',
+            'car_id': 'car_id',
+            'car_make': 'car__make',
+            'car_model': 'car__model',
+            'start_date': 'start_date',
+            'end_date': 'end_date',
+            'total_cost': 'total_cost',
+            'status': 'status',
+            'created_at': 'created_at',
+            'updated_at': 'updated_at',
+        },
+    },
+    'reviews': {
+        'model': Review,
+        'columns': {
+            'id': 'id',
+            'user_id': 'user_id',
+            'username': 'user__username',
+            'car_id': 'car_id',
+            'rating': 'rating',
+            'comment': 'comment',
+            'created_at': 'created_at',
+        },
+    },
+    'fleet': {
+        'model': Car,
+        'columns': {
+            'id': 'id',
+            'make': 'make',
+            'model': 'model',
+            'year': 'year',
+            'category': 'category__name',
+            'transmission': 'transmission',
+            'fuel_type': 'fuel_type',
+            'seats': 'seats',
+            'daily_rate': 'daily_rate',
+            'weekend_rate': 'weekend_rate',
+            'mileage': 'mileage',
+            'license_plate': 'license_plate',
+            'is_available': 'is_available',
+            'review_count': 'review_count',
+            'rating_sum': 'rating_sum',
+            'pending_bookings': 'pending_bookings',
+            'confirmed_bookings': 'confirmed_bookings',
+            'active_bookings': 'active_bookings',
+            'completed_bookings': 'completed_bookings',
+            'cancelled_bookings': 'cancelled_bookings',
+            'created_at': 'created_at',
+            'updated_at': 'updated_at',
+        },
+    },
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_queryset(name, date_range=None, statuses=None):
+    """Rows of one export as tuples, in `EXPORTS[name]['columns']` order.
+
+    Bookings are kept when they overlap `date_range`; reviews and cars when
+    they were created inside it. `statuses` only applies to bookings.
+    """
+    spec = EXPORTS[name]
+    queryset = spec['model'].objects.all()
+    if date_range is not None:
+        start_date, end_date = date_range
+        if name == 'bookings':
+            queryset = queryset.filter(start_date__lte=end_date, end_date__gte=start_date)
+        else:
+            queryset = queryset.filter(created_at__date__range=(start_date, end_date))
+    if statuses:
+        if name != 'bookings':
+            raise ValidationError({"error": "status can only be used with the bookings export"})
+        valid = dict(Booking.STATUS_CHOICES)
+        unknown = [value for value in statuses if value not in valid]
+        if unknown:
+            raise ValidationError({"error": f"Unknown booking status: {', '.join(unknown)}"})
+        queryset = queryset.filter(status__in=statuses)
+    # A plain values projection read in chunks (a server-side cursor on
+    # PostgreSQL), so memory use does not grow with the table
+    return queryset.order_by('id').values_list(*spec['columns'].values()).iterator(
+        chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    )
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(name, file_format, date_range=None, statuses=None):
+    """Lazily yield the lines of an export in 'csv' or 'ndjson'."""
+    columns = list(EXPORTS[name]['columns'])
+    rows = export_queryset(name, date_range, statuses)
+    if file_format == 'csv':
+        return csv_lines(columns, rows)
+    return ndjson_lines(columns, rows)
@@ -0,0 +1,108 @@
+import hashlib
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .filters import has_feature
+from .generations import BOOKING_GENERATION_KEY, CATALOGUE_GENERATION_KEY, current_generations
+from .models import Car, CarCategory, CarFeature
+
+# Daily rate buckets as [min, max) pairs; None leaves a side open
+PRICE_BUCKETS = ((0, 50), (50, 100), (100, 150), (150, 200), (200, None))
+
+# Query parameters that change the facet counts
+FACET_PARAMS = (
+    'search', 'start_date', 'end_date', 'category', 'fuel_type',
+    'transmission', 'seats', 'feature', 'min_rate', 'max_rate',
+)
+
+
+def facet_cache_key(request):
+    params = sorted(
+        (name, request.query_params.get(name, '')) for name in FACET_PARAMS
+        if request.query_params.get(name)
+    )
+    keys = [CATALOGUE_GENERATION_KEY]
+    if request.query_params.get('start_date') or request.query_params.get('end_date'):
+        keys.append(BOOKING_GENERATION_KEY)
+    generations = [current_generations(keys)[key] for key in keys]
+    digest = hashlib.md5(repr((generations, params)).encode()).hexdigest()
+    return f'cars:facets:{digest}'
+
+
+def count_where(*conditions):
+    conditions = [condition for condition in conditions if condition]
+    return Count('pk', filter=reduce(and_, conditions) if conditions else None)
+
+
+def facet_counts(queryset, facet_filters):
+    """Count cars per facet value in a single aggregate query.
+
+    Each facet is counted under every active filter except its own, so the
+    numbers show what selecting another value of that facet would return.
+    Features are the exception: they are combined with AND, so their counts
+    keep the current feature selection.
+    """
+    def others(name):
+        return [condition for facet, condition in facet_filters.items() if facet != name]
+
+    categories = list(CarCategory.objects.order_by('name').values_list('id', 'name'))
+    features = list(CarFeature.objects.order_by('name').values_list('id', 'name'))
+    seat_values = range(1, 16)
+
+    aggregates = {'total': count_where(*facet_filters.values())}
+    for category_id, _ in categories:
+        aggregates[f'category_{category_id}'] = count_where(Q(category_id=category_id), *others('category'))
+    for name in ('fuel_type', 'transmission'):
+        for value, _ in Car._meta.get_field(name).choices:
+            aggregates[f'{name}_{value}'] = count_where(Q(**{name: value}), *others(name))
+    for seats in seat_values:
+        aggregates[f'seats_{seats}'] = count_where(Q(seats=seats), *others('seats'))
+    for feature_id, _ in features:
+        aggregates[f'feature_{feature_id}'] = count_where(Q(has_feature(feature_id)), *facet_filters.values())
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        bucket = Q(daily_rate__gte=low)
+        if high is not None:
+            bucket &= Q(daily_rate__lt=high)
+        aggregates[f'price_{i}'] = count_where(bucket, *others('price'))
+
+    counts = queryset.aggregate(**aggregates)
+
+    def choices(name):
+        return [
+            {'value': value, 'label': label, 'count': counts[f'{name}_{value}']}
+            for value, label in Car._meta.get_field(name).choices
+        ]
+
+    return {
+        'count': counts['total'],
+        'facets': {
+            'category': [
+                {'value': category_id, 'label': name, 'count': counts[f'category_{category_id}']}
+                for category_id, name in categories
+            ],
+            'fuel_type': choices('fuel_type'),
+            'transmission': choices('transmission'),
+            'seats': [{'value': seats, 'count': counts[f'seats_{seats}']} for seats in seat_values],
+            'feature': [
+                {'value': feature_id, 'label': name, 'count': counts[f'feature_{feature_id}']}
+                for feature_id, name in features
+            ],
+            'price': [
+                {'min': low, 'max': high, 'count': counts[f'price_{i}']}
+                for i, (low, high) in enumerate(PRICE_BUCKETS)
+            ],
+        },
+    }
+
+
+def cached_facet_counts(request, queryset, facet_filters):
+    key = facet_cache_key(request)
+    result = cache.get(key)
+    if result is None:
+        result = facet_counts(queryset, facet_filters)
+        cache.set(key, result, getattr(settings, 'CAR_FACETS_CACHE_TIMEOUT', 300))
+    return result
@@ -0,0 +1,98 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, OuterRef, Q
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from .availability import availability_index
+from .models import Car
+
+
+def split_param(request, name):
+    value = request.query_params.get(name, '')
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def int_list(request, name):
+    try:
+        return [int(part) for part in split_param(request, name)]
+    except ValueError:
+        raise ValidationError({"error": f"{name} must be a comma-separated list of whole numbers"})
+
+
+def has_feature(feature_id):
+    return Exists(Car.features.through.objects.filter(car_id=OuterRef('pk'), carfeature_id=feature_id))
+
+
+def parse_date_range(request):
+    """Return (start_date, end_date) from the query string, or None if not given."""
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    if not start_date and not end_date:
+        return None
+    if not start_date or not end_date:
+        raise ValidationError({"error": "Please provide start_date and end_date parameters"})
+    try:
+        return (
+            datetime.strptime(start_date, '%Y-%m-%d').date(),
+            datetime.strptime(end_date, '%Y-%m-%d').date(),
+        )
+    except ValueError:
+        raise ValidationError({"error": "Invalid date format. Use YYYY-MM-DD"})
+
+
+class CarFacetFilter(filters.BaseFilterBackend):
+    """Filter cars by category, fuel_type, transmission, seats, feature and price.
+
+    Each parameter takes a comma-separated list; values of one parameter are
+    OR-ed, except `feature` where a car must have every listed feature.
+    `min_rate` / `max_rate` bound the daily rate.
+    """
+
+    def get_facet_filters(self, request):
+        """Return one Q object per active facet, keyed by facet name."""
+        facet_filters = {}
+        categories = int_list(request, 'category')
+        if categories:
+            facet_filters['category'] = Q(category_id__in=categories)
+        for name in ('fuel_type', 'transmission'):
+            values = split_param(request, name)
+            if values:
+                facet_filters[name] = Q(**{f'{name}__in': values})
+        seats = int_list(request, 'seats')
+        if seats:
+            facet_filters['seats'] = Q(seats__in=seats)
+        features = int_list(request, 'feature')
+        if features:
+            condition = Q()
+            for feature_id in features:
+                condition &= Q(has_feature(feature_id))
+            facet_filters['feature'] = condition
+
+        price = Q()
+        try:
+            if request.query_params.get('min_rate'):
+                price &= Q(daily_rate__gte=Decimal(request.query_params['min_rate']))
+            if request.query_params.get('max_rate'):
+                price &= Q(daily_rate__lt=Decimal(request.query_params['max_rate']))
+        except InvalidOperation:
+            raise ValidationError({"error": "min_rate and max_rate must be numbers"})
+        if price:
+            facet_filters['price'] = price
+        return facet_filters
+
+    def filter_queryset(self, request, queryset, view):
+        for condition in self.get_facet_filters(request).values():
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class CarAvailabilityFilter(filters.BaseFilterBackend):
+    """Keep only cars free for `start_date`..`end_date` when both are given."""
+
+    def filter_queryset(self, request, queryset, view):
+        date_range = parse_date_range(request)
+        if date_range is None:
+            return queryset
+        return queryset.exclude(id__in=availability_index.unavailable_car_ids(*date_range))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.cache import cache
+
+# Counters in the default cache that cached data is keyed by; bumping one
+# makes everything cached under the old value unreachable
+CATALOGUE_GENERATION_KEY = 'cars:facets:catalogue'
+BOOKING_GENERATION_KEY = 'cars:facets:bookings'
+
+
+def new_generation():
+    # Later than any value an evicted key held, so entries cached under it stay unreachable
+    return time.time_ns()
+
+
+def bump_generation(key):
+    """Invalidate every cached entry that depends on `key` and return the new generation."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = new_generation()
+        cache.set(key, generation, None)
+        return generation
+
+
+def current_generations(keys):
+    """The generation stored under each key, {key: value}; missing keys get a new one"""
+    generations = cache.get_many(keys)
+    missing = {key: new_generation() for key in keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return generations
@@ -0,0 +1,113 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import CarImage
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of each derivative, in pixels
+DERIVATIVE_SIZES = {
+    'thumbnail': 320,
+    'medium': 800,
+    'large': 1600,
+}
+DERIVATIVE_FORMATS = {
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+_executor = None
+
+
+def executor():
+    """Shared pool; Pillow releases the GIL while resizing and encoding."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+            thread_name_prefix='car-image',
+        )
+    return _executor
+
+
+def derivative_path(image, name, extension):
+    return posixpath.join('cars', 'derivatives', str(image.pk), f'{name}.{extension}')
+
+
+def render_derivatives(image):
+    """Write every size and format of `image` to storage.
+
+    Returns the stored paths keyed by size, then by format. Sizes are never
+    upscaled past the original.
+    """
+    with image.image.open('rb') as original:
+        with Image.open(original) as source:
+            source = ImageOps.exif_transpose(source)
+            source = source.convert('RGB')
+
+    derivatives = {}
+    for name, edge in DERIVATIVE_SIZES.items():
+        resized = source.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        derivatives[name] = {}
+        for extension, (image_format, options) in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            path = derivative_path(image, name, 'jpg' if extension == 'jpeg' else extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            derivatives[name][extension] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def generate_derivatives(image_id):
+    """Render and record the derivatives of one CarImage; safe to run in a worker."""
+    close_old_connections()
+    try:
+        image = CarImage.objects.filter(pk=image_id).first()
+        if image is None or not image.image:
+            return None
+        source_name = image.image.name
+        derivatives = render_derivatives(image)
+        # Skip the write if the image was replaced while we were rendering
+        CarImage.objects.filter(pk=image_id, image=source_name).update(
+            derivatives=derivatives, updated_at=timezone.now()
+        )
+        return derivatives
+    except Exception:
+        logger.exception('Could not generate derivatives for car image %s', image_id)
+        return None
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(image_id):
+    """Queue derivative generation once the current transaction commits."""
+    transaction.on_commit(lambda: executor().submit(generate_derivatives, image_id))
+
+
+def delete_derivatives(derivatives):
+    for formats in (derivatives or {}).values():
+        for path in formats.values():
+            default_storage.delete(path)
+
+
+def derivative_urls(image, request=None):
+    """Derivative URLs of `image`, absolute when a request is given."""
+    def url(path):
+        url = default_storage.url(path)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return {
+        name: {extension: url(path) for extension, path in formats.items()}
+        for name, formats in (image.derivatives or {}).items()
+    }
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cars.images import generate_derivatives
+from cars.models import CarImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail / medium / large derivatives for car images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate derivatives for every image')
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+            help='Images processed in parallel',
+        )
+
+    def handle(self, *args, **options):
+        images = CarImage.objects.exclude(image='')
+        if not options['all']:
+            images = images.filter(derivatives={})
+        image_ids = list(images.order_by('pk').values_list('pk', flat=True))
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for image_id, derivatives in zip(image_ids, pool.map(generate_derivatives, image_ids)):
+                if derivatives is None:
+                    failed += 1
+                    self.stderr.write(f'Image {image_id}: failed, see the log for details')
+                else:
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {done} images ({failed} failed)'
+        ))
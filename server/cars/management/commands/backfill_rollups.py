@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.rollups import rebuild_rollups
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}. Use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily utilization and revenue rollups from the bookings. '
+        'Without dates every day is rebuilt; with --start-date / --end-date only that window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='YYYY-MM-DD')
+        parser.add_argument('--end-date', help='YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=500, help='Cars per transaction')
+
+    def handle(self, *args, **options):
+        first_day = parse_date(options['start_date']) if options['start_date'] else None
+        last_day = parse_date(options['end_date']) if options['end_date'] else None
+        if first_day and last_day and last_day < first_day:
+            raise CommandError('--end-date cannot be before --start-date')
+        written = rebuild_rollups(first_day, last_day, batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} car-day rollup rows'))
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import platform
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cars.models import Booking, Car, Review
+
+BENCHMARK_USERNAME = 'benchmark-api'
+
+
+def date_range(rng, days_ahead=90, max_length=7):
+    start = date.today() + timedelta(days=rng.randrange(days_ahead))
+    return start, start + timedelta(days=rng.randrange(max_length))
+
+
+def far_future_range(rng):
+    # Well clear of generated bookings, so creates rarely conflict
+    start = date.today() + timedelta(days=3 * 365 + rng.randrange(3 * 365))
+    return start, start + timedelta(days=rng.randrange(4))
+
+
+# Ids the request builders pick from: up to 5000 cars and every category with cars
+Sample = namedtuple('Sample', ['cars', 'categories'])
+
+# name -> (needs login, request builder). Builders get a random.Random and a
+# Sample, and return (method, path, json body or None).
+SCENARIOS = {
+    'cars-list': (False, lambda rng, sample: ('get', '/api/cars/', None)),
+    'cars-list-deep-page': (False, lambda rng, sample: ('get', f'/api/cars/?page={rng.randint(2, 20)}', None)),
+    'cars-cursor': (False, lambda rng, sample: ('get', '/api/cars/?pagination=cursor&ordering=daily_rate', None)),
+    'cars-search': (False, lambda rng, sample: (
+        'get', f'/api/cars/?search={rng.choice(["toyota", "bmw", "suv", "golf", "electric"])}', None,
+    )),
+    'cars-detail': (False, lambda rng, sample: ('get', f'/api/cars/{rng.choice(sample.cars)}/', None)),
+    'cars-available': (False, lambda rng, sample: (
+        'get', '/api/cars/available/?start_date={}&end_date={}'.format(*date_range(rng)), None,
+    )),
+    'cars-statistics': (False, lambda rng, sample: ('get', f'/api/cars/{rng.choice(sample.cars)}/statistics/', None)),
+    'cars-similar': (False, lambda rng, sample: ('get', f'/api/cars/{rng.choice(sample.cars)}/similar/', None)),
+    'cars-calendar': (False, lambda rng, sample: ('get', f'/api/cars/{rng.choice(sample.cars)}/calendar/', None)),
+    'cars-category-calendar': (False, lambda rng, sample: (
+        'get', f'/api/cars/calendar/?category={rng.choice(sample.categories)}', None,
+    )),
+    'cars-facets': (False, lambda rng, sample: ('get', '/api/cars/facets/', None)),
+    'cars-quote': (False, lambda rng, sample: (
+        'get', '/api/cars/quote/?start_date={}&end_date={}'.format(*date_range(rng)), None,
+    )),
+    'bookings-list': (True, lambda rng, sample: ('get', '/api/bookings/', None)),
+    'bookings-dashboard': (True, lambda rng, sample: ('get', '/api/bookings/dashboard/', None)),
+    'bookings-create': (True, lambda rng, sample: ('post', '/api/bookings/', dict(zip(
+        ('car_id', 'start_date', 'end_date'), (rng.choice(sample.cars), *map(str, far_future_range(rng))),
+    )))),
+    'categories-list': (False, lambda rng, sample: ('get', '/api/categories/', None)),
+    'features-list': (False, lambda rng, sample: ('get', '/api/features/', None)),
+    'reviews-list': (False, lambda rng, sample: ('get', '/api/reviews/', None)),
+    'car-reviews': (False, lambda rng, sample: ('get', f'/api/cars/{rng.choice(sample.cars)}/reviews/', None)),
+}
+
+
+def async_variant(build):
+    def build_async(rng, sample):
+        method, path, body = build(rng, sample)
+        return method, path.replace('/api/', '/api/async/', 1), body
+    return build_async
+
+
+# The same requests against the async catalogue routes, e.g. async-cars-list
+SCENARIOS.update({
+    f'async-{name}': (needs_login, async_variant(build))
+    for name, (needs_login, build) in list(SCENARIOS.items())
+    if name in ('cars-list', 'cars-cursor', 'cars-detail', 'cars-available', 'cars-statistics',
+                'categories-list', 'features-list')
+})
+
+
+def header_queries(response):
+    """Query count from the Server-Timing header set by PerformanceMetricsMiddleware"""
+    match = re.search(r'(\d+) queries', response.headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def summarize(samples, wall_time):
+    """Latency percentiles (ms), throughput and queries per request."""
+    latencies = np.array([sample['latency'] for sample in samples]) * 1000
+    queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'statuses': statuses,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'mean_ms': round(float(latencies.mean()), 2),
+        'requests_per_second': round(len(samples) / wall_time, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main API endpoints in-process and report p50/p95/p99 '
+        'latency, requests per second and queries per request. Runs against '
+        'the configured database (SQLite or PostgreSQL). To compare the sync '
+        'and async catalogue routes, run e.g. --mode asgi --scenario cars-list '
+        '--scenario async-cars-list.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Repeatable; default all')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument(
+            '--mode', choices=['client', 'threads', 'asgi'], default='client',
+            help='client: one request at a time; threads: a WSGI test client per thread; '
+                 'asgi: concurrent AsyncClient requests',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed-cars', type=int, default=0,
+                            help='Run generate_load_data first when there are fewer cars than this')
+        parser.add_argument('--allow-seed', action='store_true',
+                            help='Let --seed-cars write to the database when DEBUG is off')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Earlier results JSON to compare against')
+
+    def handle(self, *args, **options):
+        if options['seed_cars'] and Car.objects.count() < options['seed_cars']:
+            database = f"'{connection.alias}' ({connection.vendor} database {connection.settings_dict['NAME']})"
+            if not settings.DEBUG and not options['allow_seed']:
+                raise CommandError(
+                    f'--seed-cars would write load data to {database} with DEBUG off. '
+                    'Pass --allow-seed if that is really a scratch database'
+                )
+            self.stdout.write(f'Writing load data to {database}')
+            call_command(
+                'generate_load_data', cars=options['seed_cars'] - Car.objects.count(),
+                users=max(100, options['seed_cars'] // 10), seed=self.unused_seed(options['seed']),
+                stdout=self.stdout,
+            )
+        car_ids = list(Car.objects.order_by('id').values_list('id', flat=True)[:5000])
+        if not car_ids:
+            raise CommandError('No cars found. Run generate_load_data or pass --seed-cars')
+        category_ids = list(
+            Car.objects.exclude(category=None).order_by('category_id').values_list('category_id', flat=True).distinct()
+        )
+        scenarios = options['scenario'] or list(SCENARIOS)
+        if not category_ids and 'cars-category-calendar' in scenarios:
+            self.stderr.write('Skipping cars-category-calendar: no car has a category')
+            scenarios.remove('cars-category-calendar')
+        self.user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        self.sample = Sample(car_ids, category_ids)
+
+        results = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'mode': options['mode'],
+                'concurrency': options['concurrency'] if options['mode'] != 'client' else 1,
+                'cars': Car.objects.count(),
+                'bookings': Booking.objects.count(),
+                'reviews': Review.objects.count(),
+            },
+            'scenarios': {},
+        }
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for name in scenarios:
+                    results['scenarios'][name] = self.run_scenario(name, options)
+                    self.report(name, results['scenarios'][name])
+        finally:
+            Booking.objects.filter(user=self.user).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def unused_seed(self, seed):
+        """The first seed from `seed` on that generate_load_data has not used yet"""
+        while Car.objects.filter(license_plate__startswith=f'load{seed}-').exists():
+            seed += 1
+        return seed
+
+    def run_scenario(self, name, options):
+        needs_login, build = SCENARIOS[name]
+        rng = random.Random(f'{options["seed"]}-{name}')
+        total = options['warmup'] + options['requests']
+        requests = [build(rng, self.sample) for _ in range(total)]
+        warmup, measured = requests[:options['warmup']], requests[options['warmup']:]
+        if options['mode'] == 'asgi':
+            return asyncio.run(self.run_async(warmup, measured, needs_login, options['concurrency']))
+        concurrency = options['concurrency'] if options['mode'] == 'threads' else 1
+        return self.run_threads(warmup, measured, needs_login, concurrency)
+
+    def client(self, needs_login):
+        client = Client()
+        if needs_login:
+            client.force_login(self.user)
+        return client
+
+    def run_threads(self, warmup, measured, needs_login, concurrency):
+        local = threading.local()
+
+        def send(request):
+            if not hasattr(local, 'client'):
+                close_old_connections()
+                local.client = self.client(needs_login)
+            method, path, body = request
+            kwargs = {'data': body, 'content_type': 'application/json'} if body is not None else {}
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(local.client, method)(path, **kwargs)
+                latency = time.perf_counter() - started
+            return {'latency': latency, 'status': response.status_code, 'queries': len(queries)}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, warmup))
+            started = time.perf_counter()
+            samples = list(pool.map(send, measured))
+            wall_time = time.perf_counter() - started
+            # Each worker thread holds its own connection; have every one close it
+            barrier = threading.Barrier(concurrency)
+
+            def close(_):
+                barrier.wait()
+                connection.close()
+
+            list(pool.map(close, range(concurrency)))
+        return summarize(samples, wall_time)
+
+    async def run_async(self, warmup, measured, needs_login, concurrency):
+        client = AsyncClient()
+        if needs_login:
+            await client.aforce_login(self.user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            method, path, body = request
+            kwargs = {'data': body, 'content_type': 'application/json'} if body is not None else {}
+            async with semaphore:
+                started = time.perf_counter()
+                response = await getattr(client, method)(path, **kwargs)
+                latency = time.perf_counter() - started
+            return {'latency': latency, 'status': response.status_code, 'queries': header_queries(response)}
+
+        await asyncio.gather(*(send(request) for request in warmup))
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(send(request) for request in measured))
+        return summarize(samples, time.perf_counter() - started)
+
+    def report(self, name, result):
+        queries = result['queries_per_request']
+        self.stdout.write(
+            f"{name:22} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+            f"p99 {result['p99_ms']:8.2f}ms  {result['requests_per_second']:8.1f} req/s  "
+            f"{'-' if queries is None else queries:>6} queries  {result['statuses']}"
+        )
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['scenarios']
+        self.stdout.write(f'\nChange against {path} (negative latency change is faster):')
+        for name, result in results['scenarios'].items():
+            before = previous.get(name)
+            if before is None:
+                continue
+
+            def change(key):
+                return (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+
+            self.stdout.write(
+                f"{name:22} p50 {change('p50_ms'):+7.1f}%  p95 {change('p95_ms'):+7.1f}%  "
+                f"p99 {change('p99_ms'):+7.1f}%  req/s {change('requests_per_second'):+7.1f}%"
+            )
@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.availability import availability_index
+
+
+class Command(BaseCommand):
+    help = 'Check the in-memory availability index against the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to check (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--days', type=int, default=90, help='Number of days to check')
+        parser.add_argument('--span', type=int, default=3, help='Length of each checked range in days')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else date.today()
+        except ValueError:
+            raise CommandError('Invalid --start date. Use YYYY-MM-DD')
+
+        availability_index.rebuild()
+        span = timedelta(days=options['span'] - 1)
+        mismatches = 0
+        for offset in range(options['days']):
+            range_start = start + timedelta(days=offset)
+            range_end = range_start + span
+            missing, extra = availability_index.verify(range_start, range_end)
+            if missing or extra:
+                mismatches += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{range_start} to {range_end}: missing {sorted(missing)}, extra {sorted(extra)}'
+                ))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} date ranges disagree with the database')
+        self.stdout.write(self.style.SUCCESS(
+            f'Availability index matches the database for {options["days"]} date ranges'
+        ))
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from cars.exports import EXPORT_FORMATS, EXPORTS, export_lines
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}. Use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Stream a bookings, reviews or fleet export as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', dest='file_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--start-date', help='YYYY-MM-DD, needs --end-date')
+        parser.add_argument('--end-date', help='YYYY-MM-DD, needs --start-date')
+        parser.add_argument('--status', action='append', default=[], help='Booking status code, repeatable')
+
+    def handle(self, *args, **options):
+        date_range = None
+        if options['start_date'] or options['end_date']:
+            if not (options['start_date'] and options['end_date']):
+                raise CommandError('Pass both --start-date and --end-date')
+            date_range = (parse_date(options['start_date']), parse_date(options['end_date']))
+
+        try:
+            lines = export_lines(options['name'], options['file_format'], date_range, options['status'])
+        except ValidationError as error:
+            raise CommandError(error.detail['error'])
+
+        if options['output']:
+            rows = 0
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for line in lines:
+                    output.write(line)
+                    rows += 1
+            if options['file_format'] == 'csv':
+                rows -= 1  # header
+            self.stderr.write(self.style.SUCCESS(f'Wrote {rows} rows to {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,217 @@
+from datetime import date, timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cars.bulk import insert_rows, refresh_derived_data
+from cars.rollups import rebuild_rollups
+from cars.models import Booking, Car, CarCategory, CarFeature, Review
+from cars.pricing import cents_to_decimal, day_split
+
+# make -> (models, base daily rate)
+MAKES = {
+    'Toyota': (['Corolla', 'Camry', 'RAV4', 'Yaris', 'Hilux', 'Prius'], 45),
+    'Honda': (['Civic', 'Accord', 'CR-V', 'Jazz', 'HR-V'], 45),
+    'Ford': (['Fiesta', 'Focus', 'Puma', 'Kuga', 'Ranger', 'Mustang'], 50),
+    'Volkswagen': (['Polo', 'Golf', 'Passat', 'Tiguan', 'ID.4'], 50),
+    'BMW': (['1 Series', '3 Series', '5 Series', 'X3', 'X5', 'i4'], 90),
+    'Mercedes-Benz': (['A-Class', 'C-Class', 'E-Class', 'GLC', 'EQA'], 95),
+    'Tesla': (['Model 3', 'Model Y', 'Model S'], 110),
+    'Kia': (['Picanto', 'Rio', 'Ceed', 'Sportage', 'Niro'], 35),
+    'Nissan': (['Micra', 'Qashqai', 'Leaf', 'X-Trail'], 40),
+    'Porsche': (['911', 'Cayenne', 'Taycan'], 250),
+}
+CATEGORIES = ['Economy', 'Compact', 'Sedan', 'SUV', 'Luxury', 'Sports', 'Electric', 'Van']
+FEATURES = [
+    'GPS Navigation', 'Bluetooth', 'Air Conditioning', 'Sunroof', 'Cruise Control',
+    'Heated Seats', 'Parking Sensors', 'Apple CarPlay', 'Child Seat', 'Roof Rack',
+]
+# Rating weights for 1..5 stars, and a comment per rating
+RATING_WEIGHTS = [0.04, 0.06, 0.15, 0.35, 0.40]
+COMMENTS = [
+    'Would not rent again.',
+    'Had a few problems with the car.',
+    'Did the job.',
+    'Clean and comfortable, pickup was quick.',
+    'Excellent car, would rent again!',
+]
+BOOKING_FIELDS = ('user', 'car', 'start_date', 'end_date', 'total_cost', 'status', 'created_at', 'updated_at')
+REVIEW_FIELDS = ('user', 'car', 'rating', 'comment', 'created_at')
+
+
+def to_datetimes(values):
+    """numpy datetime64[s] array -> aware datetimes"""
+    return [value.replace(tzinfo=timezone.utc) for value in values.astype('datetime64[s]').tolist()]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large, reproducible data set of users, cars, bookings and '
+        'reviews for load testing. The same --seed and --today always produce the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--bookings-per-car', type=int, default=40, help='Average bookings per car')
+        parser.add_argument('--reviews-per-car', type=int, default=10, help='Average reviews per car')
+        parser.add_argument('--years', type=int, default=2, help='Years of booking history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--today', type=date.fromisoformat,
+            help='Date (YYYY-MM-DD) the booking history and statuses are laid out around; default today',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Cars per transaction')
+
+    def handle(self, *args, **options):
+        self.rng = np.random.default_rng(options['seed'])
+        self.prefix = f'load{options["seed"]}'
+        if Car.objects.filter(license_plate__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Data for seed {options["seed"]} already exists. Pick another --seed')
+
+        self.today = np.datetime64(options['today'] or date.today(), 'D')
+        self.origin = self.today - 365 * options['years']
+        # Leave room for a few months of future bookings as well
+        self.span = 365 * options['years'] + 90
+
+        user_ids = self.create_users(options['users'])
+        category_ids = self.ensure(CarCategory, CATEGORIES, description='')
+        feature_ids = self.ensure(CarFeature, FEATURES)
+
+        totals = {'cars': 0, 'bookings': 0, 'reviews': 0}
+        batch_size = max(1, options['batch_size'])
+        for first in range(0, options['cars'], batch_size):
+            count = min(batch_size, options['cars'] - first)
+            with transaction.atomic():
+                cars = self.create_cars(first, count, category_ids, feature_ids)
+                totals['cars'] += len(cars)
+                totals['bookings'] += self.create_bookings(cars, user_ids, options['bookings_per_car'])
+                totals['reviews'] += self.create_reviews(cars, user_ids, options['reviews_per_car'])
+            self.stdout.write(
+                f'{totals["cars"]} cars, {totals["bookings"]} bookings, {totals["reviews"]} reviews'
+            )
+
+        self.stdout.write('Refreshing counters, search vectors and caches...')
+        refresh_derived_data()
+        self.stdout.write('Rebuilding daily rollups...')
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {totals["cars"]} cars, {totals["bookings"]} bookings and '
+            f'{totals["reviews"]} reviews for {len(user_ids)} users'
+        ))
+
+    def ensure(self, model, names, **defaults):
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        model.objects.bulk_create([model(name=name, **defaults) for name in names if name not in existing])
+        return list(model.objects.filter(name__in=names).order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count):
+        usernames = [f'{self.prefix}-user-{i}' for i in range(count)]
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=username, password=password) for username in usernames],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        return np.array(
+            User.objects.filter(username__startswith=f'{self.prefix}-user-').order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def create_cars(self, first, count, category_ids, feature_ids):
+        rng = self.rng
+        makes = list(MAKES)
+        make_index = rng.integers(len(makes), size=count)
+        model_index = rng.integers(1000, size=count)
+        years = rng.integers(2015, 2027, size=count)
+        rate_factor = rng.uniform(0.8, 1.4, size=count)
+        has_weekend_rate = rng.random(count) < 0.7
+        cars = []
+        for i in range(count):
+            make = makes[make_index[i]]
+            models, base_rate = MAKES[make]
+            daily_rate = Decimal(round(base_rate * rate_factor[i]))
+            cars.append(Car(
+                make=make,
+                model=models[model_index[i] % len(models)],
+                year=int(years[i]),
+                category_id=int(rng.choice(category_ids)),
+                transmission='A' if rng.random() < 0.7 else 'M',
+                fuel_type=str(rng.choice(['P', 'D', 'E', 'H'], p=[0.5, 0.2, 0.15, 0.15])),
+                seats=int(rng.choice([2, 4, 5, 7, 9], p=[0.05, 0.15, 0.6, 0.15, 0.05])),
+                daily_rate=daily_rate,
+                weekend_rate=Decimal(round(daily_rate * Decimal('1.2'))) if has_weekend_rate[i] else None,
+                mileage=int(rng.integers(1000, 120000)),
+                license_plate=f'{self.prefix}-{first + i:07d}',
+                description=f'{years[i]} {make} {models[model_index[i] % len(models)]}, generated for load testing.',
+                specifications={'seed_index': first + i},
+            ))
+        Car.objects.bulk_create(cars)
+
+        has_feature = rng.random((count, len(feature_ids))) < 0.4
+        insert_rows(Car.features.through, ('car', 'carfeature'), [
+            (cars[i].pk, feature_ids[j]) for i, j in zip(*np.nonzero(has_feature))
+        ])
+        return cars
+
+    def create_bookings(self, cars, user_ids, per_car):
+        """Lay out non-overlapping bookings on each car's timeline."""
+        if per_car <= 0 or not len(user_ids):
+            return 0
+        rng = self.rng
+        shape = (len(cars), per_car)
+        durations = rng.integers(1, 8, size=shape)
+        # Average gap chosen so the bookings spread over the whole span
+        max_gap = max(1, 2 * (self.span // per_car - 4))
+        gaps = rng.integers(0, max_gap + 1, size=shape)
+        offsets = np.cumsum(gaps + durations, axis=1) - durations
+        starts = (self.origin + offsets).ravel()
+        ends = starts + (durations - 1).ravel()
+
+        statuses = np.where(ends < self.today, 'CO', np.where(starts <= self.today, 'A', 'C'))
+        future = starts > self.today
+        statuses = np.where(future & (rng.random(starts.size) < 0.5), 'P', statuses)
+        statuses = np.where(rng.random(starts.size) < 0.1, 'CA', statuses)
+
+        daily = np.repeat([int(car.daily_rate * 100) for car in cars], per_car)
+        weekend = np.repeat([int((car.weekend_rate or car.daily_rate) * 100) for car in cars], per_car)
+        weekdays, weekend_days = day_split(starts, ends)
+        totals = daily * weekdays + weekend * weekend_days
+
+        created = to_datetimes(
+            starts.astype('datetime64[s]')
+            - rng.integers(1, 60 * 86400, size=starts.size).astype('timedelta64[s]')
+        )
+        car_ids = np.repeat([car.pk for car in cars], per_car)
+        users = rng.choice(user_ids, size=starts.size)
+        return insert_rows(Booking, BOOKING_FIELDS, (
+            (int(user), int(car_id), start, end, cents_to_decimal(total), str(status), created_at, created_at)
+            for user, car_id, start, end, total, status, created_at in zip(
+                users, car_ids, starts.tolist(), ends.tolist(), totals, statuses, created
+            )
+        ))
+
+    def create_reviews(self, cars, user_ids, per_car):
+        if per_car <= 0 or not len(user_ids):
+            return 0
+        rng = self.rng
+        rows = []
+        counts = np.minimum(rng.poisson(per_car, size=len(cars)), len(user_ids))
+        history_seconds = int((self.today - self.origin) / np.timedelta64(1, 's'))
+        for car, count in zip(cars, counts):
+            # One review per user and car
+            reviewers = rng.choice(user_ids, size=count, replace=False)
+            ratings = rng.choice(5, size=count, p=RATING_WEIGHTS) + 1
+            created = to_datetimes(
+                np.datetime64(self.origin, 's')
+                + rng.integers(0, history_seconds, size=count).astype('timedelta64[s]')
+            )
+            rows.extend(
+                (int(user), car.pk, int(rating), COMMENTS[rating - 1], created_at)
+                for user, rating, created_at in zip(reviewers, ratings, created)
+            )
+        return insert_rows(Review, REVIEW_FIELDS, rows)
@@ -0,0 +1,135 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cars.bulk import batched, insert_rows
+from cars.generations import CATALOGUE_GENERATION_KEY, bump_generation
+from cars.models import Car, CarCategory, CarFeature, CarImage
+from cars.search import update_search_vectors
+
+CAR_FIELDS = (
+    'make', 'model', 'year', 'transmission', 'fuel_type', 'seats', 'daily_rate',
+    'weekend_rate', 'mileage', 'license_plate', 'is_available', 'description', 'specifications',
+)
+
+
+def split_list(value):
+    if isinstance(value, list):
+        return value
+    return [part.strip() for part in (value or '').split('|') if part.strip()]
+
+
+def read_records(path, file_format):
+    """Yield one dict per car from a CSV, JSON array or JSON-lines file.
+
+    In CSV, `features` and `images` hold '|'-separated values and
+    `specifications` a JSON object; the first listed image is the primary one.
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            for record in csv.DictReader(source):
+                record['specifications'] = json.loads(record.get('specifications') or '{}')
+                yield record
+        elif file_format == 'json':
+            data = json.load(source)
+            yield from data['cars'] if isinstance(data, dict) else data
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = 'Import cars with their categories, features and images from CSV, JSON or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', dest='file_format', choices=['csv', 'json', 'ndjson'],
+            help='Defaults to the file extension',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'{path} does not exist')
+        file_format = options['file_format'] or {'.jsonl': 'ndjson'}.get(path.suffix, path.suffix.lstrip('.'))
+        if file_format not in ('csv', 'json', 'ndjson'):
+            raise CommandError('Use a .csv, .json or .ndjson file, or pass --format')
+
+        self.categories = dict(CarCategory.objects.values_list('name', 'id'))
+        self.features = dict(CarFeature.objects.values_list('name', 'id'))
+        self.seen_plates = set()
+        self.imported = self.skipped = 0
+        car_ids = []
+
+        numbered = enumerate(read_records(path, file_format), start=1)
+        for batch in batched(numbered, max(1, options['batch_size'])):
+            with transaction.atomic():
+                car_ids += self.import_batch(batch)
+            self.stdout.write(f'{self.imported} cars imported, {self.skipped} skipped')
+
+        update_search_vectors(car_ids)
+        bump_generation(CATALOGUE_GENERATION_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} cars ({self.skipped} skipped). '
+            'Run backfill_image_derivatives to render their images.'
+        ))
+
+    def resolve(self, model, cache, names, **defaults):
+        """Map names to ids, creating the missing rows in one query."""
+        missing = {name for name in names if name and name not in cache}
+        if missing:
+            created = model.objects.bulk_create([model(name=name, **defaults) for name in sorted(missing)])
+            cache.update((obj.name, obj.pk) for obj in created)
+
+    def import_batch(self, batch):
+        self.resolve(CarCategory, self.categories, [record.get('category') for _, record in batch], description='')
+        self.resolve(CarFeature, self.features, [
+            name for _, record in batch for name in split_list(record.get('features'))
+        ])
+        plates = {record.get('license_plate') for _, record in batch if record.get('license_plate')}
+        taken = set(Car.objects.filter(license_plate__in=plates).values_list('license_plate', flat=True))
+
+        cars, extras = [], []
+        for line, record in batch:
+            values = {
+                field: None if record.get(field) == '' else record.get(field)
+                for field in CAR_FIELDS if field in record
+            }
+            plate = values.get('license_plate')
+            if plate and (plate in taken or plate in self.seen_plates):
+                self.stderr.write(f'Record {line}: license plate {plate} already exists')
+                self.skipped += 1
+                continue
+            car = Car(category_id=self.categories.get(record.get('category')), **values)
+            try:
+                # Unlike the admin form, an empty specifications object is fine here
+                car.full_clean(exclude=['specifications'], validate_unique=False, validate_constraints=False)
+            except ValidationError as error:
+                self.stderr.write(f'Record {line}: {"; ".join(error.messages)}')
+                self.skipped += 1
+                continue
+            if plate:
+                self.seen_plates.add(plate)
+            cars.append(car)
+            extras.append((split_list(record.get('features')), split_list(record.get('images'))))
+
+        Car.objects.bulk_create(cars)
+        insert_rows(Car.features.through, ('car', 'carfeature'), [
+            (car.pk, self.features[name])
+            for car, (features, _) in zip(cars, extras)
+            for name in dict.fromkeys(features)
+        ])
+        CarImage.objects.bulk_create([
+            CarImage(car=car, image=image, is_primary=(i == 0))
+            for car, (_, images) in zip(cars, extras)
+            for i, image in enumerate(images)
+        ])
+        self.imported += len(cars)
+        return [car.pk for car in cars]
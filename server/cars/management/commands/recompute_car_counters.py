@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.core.management.base import BaseCommand
+
+from cars.models import Car
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized review and booking counters on every car'
+
+    def handle(self, *args, **options):
+        expressions = Car.counter_expressions()
+        with transaction.atomic():
+            drifted = Car.objects.annotate(
+                **{f'expected_{field}': expression for field, expression in expressions.items()}
+            ).filter(
+                Q(*[~Q(**{field: F(f'expected_{field}')}) for field in expressions], _connector=Q.OR)
+            )
+            drift = drifted.count()
+            Car.objects.update(**expressions)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed counters for {Car.objects.count()} cars ({drift} had drifted)'
+        ))
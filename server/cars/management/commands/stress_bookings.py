@@ -0,0 +1,86 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import APIException
+
+from cars.availability import ACTIVE_STATUSES
+from cars.bookings import BookingConflict, create_booking
+from cars.models import Booking, Car
+
+
+class Command(BaseCommand):
+    help = (
+        'Create bookings from many threads at once, then check that no two '
+        'active bookings of a car overlap and report throughput. On SQLite, '
+        'set OPTIONS["transaction_mode"] = "IMMEDIATE" to avoid lock errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=500, help='Total booking attempts')
+        parser.add_argument('--cars', type=int, default=5, help='Number of cars to spread attempts over')
+        parser.add_argument('--days', type=int, default=60, help='Width of the date window in days')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the bookings created by the run')
+
+    def handle(self, *args, **options):
+        car_ids = list(Car.objects.order_by('id').values_list('id', flat=True)[:options['cars']])
+        if not car_ids:
+            raise CommandError('No cars found. Run populate_cars first')
+        user, _ = User.objects.get_or_create(username='stress-bookings')
+
+        rng = random.Random(options['seed'])
+        first_day = date.today() + timedelta(days=365)
+        attempts = []
+        for _ in range(options['attempts']):
+            start = first_day + timedelta(days=rng.randrange(options['days']))
+            attempts.append((rng.choice(car_ids), start, start + timedelta(days=rng.randrange(5))))
+
+        results = {'created': 0, 'conflicts': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def attempt(args):
+            close_old_connections()
+            try:
+                create_booking(user, *args)
+                outcome = 'created'
+            except BookingConflict:
+                outcome = 'conflicts'
+            except (APIException, DatabaseError):
+                outcome = 'errors'
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(attempt, attempts))
+        elapsed = time.perf_counter() - started
+
+        bookings = Booking.objects.filter(user=user, status__in=ACTIVE_STATUSES)
+        overlapping = bookings.filter(Exists(
+            bookings.filter(
+                car_id=OuterRef('car_id'),
+                start_date__lte=OuterRef('end_date'),
+                end_date__gte=OuterRef('start_date'),
+            ).exclude(pk=OuterRef('pk'))
+        )).count()
+
+        self.stdout.write(
+            f"{len(attempts)} attempts on {len(car_ids)} cars with {options['threads']} threads "
+            f"in {elapsed:.2f}s ({len(attempts) / elapsed:.0f} attempts/s): "
+            f"{results['created']} created, {results['conflicts']} conflicts, {results['errors']} errors"
+        )
+        if not options['keep']:
+            Booking.objects.filter(user=user).delete()
+        if overlapping:
+            raise CommandError(f'{overlapping} active bookings overlap another booking of the same car')
+        self.stdout.write(self.style.SUCCESS('No overlapping bookings'))
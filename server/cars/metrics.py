@@ -0,0 +1,129 @@
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Timings of the request being handled, set by PerformanceMetricsMiddleware
+request_timings = ContextVar('request_timings', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestTimings:
+    """Database and serializer time collected while one request is handled."""
+
+    __slots__ = ('queries', 'db', 'serialize')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f'serialize;dur={self.serialize * 1000:.1f}, total;dur={total * 1000:.1f}'
+        )
+
+
+def current_timings():
+    return request_timings.get()
+
+
+def timed_execute(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's timings.
+
+    Installed on every connection when it opens. The timings travel in a
+    context variable, so queries made through the async ORM, which run in
+    another thread, are counted too.
+    """
+    timings = request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label set."""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self.series.items())
+        for label_values, counts, total in series:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'car_hire_request_duration_seconds', 'Time spent handling a request.',
+    ('route', 'method'), DURATION_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'car_hire_db_duration_seconds', 'Time spent in database queries per request.',
+    ('route',), DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'car_hire_db_queries', 'Database queries per request.',
+    ('route',), QUERY_COUNT_BUCKETS,
+)
+SERIALIZE_DURATION = Histogram(
+    'car_hire_serialize_duration_seconds', 'Time spent in serializers per request.',
+    ('route',), DURATION_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, SERIALIZE_DURATION)
+
+
+def record_request(route, method, timings, total):
+    REQUEST_DURATION.observe((route, method), total)
+    DB_DURATION.observe((route,), timings.db)
+    DB_QUERIES.observe((route,), timings.queries)
+    SERIALIZE_DURATION.observe((route,), timings.serialize)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process' histograms"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
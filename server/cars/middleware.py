@@ -0,0 +1,112 @@
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import RequestTimings, record_request, request_timings
+from .routers import choose_replica, replica_alias
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Set after a successful write; while present, reads go to the primary
+PRIMARY_COOKIE = 'read_primary'
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class PerformanceMetricsMiddleware:
+    """Time each request's queries, serializers and total handling.
+
+    The numbers go out in a `Server-Timing` header and into the histograms
+    served at /metrics, labelled by URL name (e.g. `car-available`).
+    Histograms live in the process, so each worker reports its own.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self.finish(request, response, timings, perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self.finish(request, response, timings, perf_counter() - started)
+
+    def finish(self, request, response, timings, total):
+        record_request(route_name(request), request.method, timings, total)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe-method requests read the catalogue from a replica.
+
+    After a successful write (a booking POST, a cancel, ...) the client gets
+    a short-lived cookie that keeps its reads on the primary for
+    REPLICA_STICKY_SECONDS, so it sees its own changes despite replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_alias.set(self.replica_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = replica_alias.set(self.replica_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+        return self.finish(request, response)
+
+    def replica_for(self, request):
+        if request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.COOKIES:
+            return choose_replica()
+        return None
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0002_carcategory_carfeature_remove_car_image_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at', 'id'], name='cars_bookin_created_d25fc1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['daily_rate', 'id'], name='cars_car_daily_r_9cbade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['year', 'id'], name='cars_car_year_ec1793_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at', 'id'], name='cars_review_created_802b80_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:10
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Snapshot of cars.search.UPDATE_SEARCH_VECTOR_SQL at the time of this migration
+UPDATE_SEARCH_VECTOR_SQL = """
+    UPDATE cars_car SET search_vector =
+        setweight(to_tsvector('english', concat_ws(' ', make, model)), 'A')
+        || setweight(to_tsvector('english', concat_ws(' ', year::text, (
+            SELECT name FROM cars_carcategory WHERE id = cars_car.category_id
+        ))), 'B')
+        || setweight(to_tsvector('english', concat_ws(' ', description, (
+            SELECT string_agg(feature.name, ' ')
+            FROM cars_car_features link
+            JOIN cars_carfeature feature ON feature.id = link.carfeature_id
+            WHERE link.car_id = cars_car.id
+        ))), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX cars_car_search_vector_gin ON cars_car USING gin (search_vector)')
+    schema_editor.execute(UPDATE_SEARCH_VECTOR_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS cars_car_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0004_catalogue_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+STATUS_COUNTERS = {
+    'P': 'pending_bookings',
+    'C': 'confirmed_bookings',
+    'A': 'active_bookings',
+    'CO': 'completed_bookings',
+    'CA': 'cancelled_bookings',
+}
+
+
+def fill_counters(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    Booking = apps.get_model('cars', 'Booking')
+    Review = apps.get_model('cars', 'Review')
+
+    def total(queryset, aggregate):
+        queryset = queryset.filter(car=OuterRef('pk')).order_by().values('car')
+        return Coalesce(Subquery(queryset.annotate(value=aggregate).values('value')), Value(0))
+
+    counters = {
+        'review_count': total(Review.objects.all(), Count('id')),
+        'rating_sum': total(Review.objects.all(), Sum('rating')),
+    }
+    for status, field in STATUS_COUNTERS.items():
+        counters[field] = total(Booking.objects.filter(status=status), Count('id'))
+    Car.objects.update(**counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0005_car_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='active_bookings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='cancelled_bookings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='completed_bookings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='confirmed_bookings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='pending_bookings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_car_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Snapshot of cars.availability.ACTIVE_STATUSES at the time of this migration
+ACTIVE_STATUSES_SQL = "('P', 'C', 'A')"
+
+OVERLAPS_SQL = f"""
+    SELECT a.id, b.id FROM cars_booking a
+    JOIN cars_booking b ON b.car_id = a.car_id AND b.id > a.id
+    WHERE a.status IN {ACTIVE_STATUSES_SQL} AND b.status IN {ACTIVE_STATUSES_SQL}
+      AND daterange(a.start_date, a.end_date, '[]') && daterange(b.start_date, b.end_date, '[]')
+    LIMIT 10
+"""
+
+
+def add_range_constraint(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        # Portable fallback: composite B-tree indexes for the date comparisons
+        where = f' WHERE status IN {ACTIVE_STATUSES_SQL}' if connection.features.supports_partial_indexes else ''
+        schema_editor.execute(
+            f'CREATE INDEX cars_booking_active_car_dates ON cars_booking (car_id, start_date, end_date){where}'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX cars_booking_active_dates ON cars_booking (start_date, end_date){where}'
+        )
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM cars_booking WHERE end_date < start_date LIMIT 10')
+        reversed_ids = [row[0] for row in cursor.fetchall()]
+        if reversed_ids:
+            raise RuntimeError(f'Bookings ending before they start, fix them first: {reversed_ids}')
+        cursor.execute(OVERLAPS_SQL)
+        overlaps = cursor.fetchall()
+        if overlaps:
+            raise RuntimeError(
+                'Overlapping active bookings for the same car, cancel one of each pair first: '
+                + ', '.join(f'{a}/{b}' for a, b in overlaps)
+            )
+
+    # btree_gist provides the GiST operator class for the car_id equality
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(f"""
+        ALTER TABLE cars_booking ADD CONSTRAINT cars_booking_no_overlap
+        EXCLUDE USING gist (car_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+        WHERE (status IN {ACTIVE_STATUSES_SQL})
+    """)
+
+
+def drop_range_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS cars_booking_active_car_dates')
+        schema_editor.execute('DROP INDEX IF EXISTS cars_booking_active_dates')
+        return
+    schema_editor.execute('ALTER TABLE cars_booking DROP CONSTRAINT IF EXISTS cars_booking_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0007_carimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_range_constraint, drop_range_constraint),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0008_booking_daterange_exclusion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('car', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='cars.car')),
+                ('category', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cars.carcategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='cars_cardai_day_034f86_idx')],
+                'constraints': [models.UniqueConstraint(fields=('car', 'day'), name='cars_rollup_car_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='cars.carcategory')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'day'), name='cars_rollup_category_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0009_daily_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['car', 'created_at', 'id'], name='cars_review_car_id_3b6d66_idx'),
+        ),
+    ]
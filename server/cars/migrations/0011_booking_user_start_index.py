@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0010_review_car_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'start_date'], name='cars_bookin_user_id_9ebf06_idx'),
+        ),
+    ]
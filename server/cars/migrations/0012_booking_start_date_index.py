@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0011_booking_user_start_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['start_date'], name='cars_bookin_start_d_219efe_idx'),
+        ),
+    ]
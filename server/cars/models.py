@@ -1,10 +1,18 @@
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 class CarCategory(models.Model):
     name = models.CharField(max_length=50)  # e.g., SUV, Sedan, Sports
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -15,6 +23,7 @@ class CarCategory(models.Model):
 class CarFeature(models.Model):
     name = models.CharField(max_length=50)  # e.g., GPS, Bluetooth, Sunroof
     icon = models.CharField(max_length=50, help_text="Font Awesome icon class", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -25,10 +34,32 @@ class CarImage(models.Model):
     is_primary = models.BooleanField(default=False)
     caption = models.CharField(max_length=200, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Storage paths of the resized copies written by cars.images, by size then format
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"Image for {self.car} - {'Primary' if self.is_primary else 'Secondary'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._source_image = instance.image.name
+        return instance
+
+# Car counter field for each booking status
+BOOKING_STATUS_COUNTERS = {
+    'P': 'pending_bookings',
+    'C': 'confirmed_bookings',
+    'A': 'active_bookings',
+    'CO': 'completed_bookings',
+    'CA': 'cancelled_bookings',
+}
+
+# Car columns written only by UPDATEs from Review/Booking writes and cars.search
+MAINTAINED_CAR_FIELDS = ('search_vector', 'review_count', 'rating_sum', *BOOKING_STATUS_COUNTERS.values())
+
 class Car(models.Model):
     TRANSMISSION_CHOICES = [
         ('A', 'Automatic'),
@@ -82,10 +113,84 @@ class Car(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by cars.search on PostgreSQL (GIN indexed), unused elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Counters maintained by Review and Booking writes; recompute_car_counters repairs drift
+    review_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
+    pending_bookings = models.IntegerField(default=0, editable=False)
+    confirmed_bookings = models.IntegerField(default=0, editable=False)
+    active_bookings = models.IntegerField(default=0, editable=False)
+    completed_bookings = models.IntegerField(default=0, editable=False)
+    cancelled_bookings = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination keys
+            models.Index(fields=['daily_rate', 'id']),
+            models.Index(fields=['year', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.year} {self.make} {self.model}"
 
+    def save(self, *args, **kwargs):
+        """Save, leaving the counters and search vector to the UPDATEs that maintain them.
+
+        An instance loaded before a review or booking was written holds stale
+        counters; writing every column back would undo that F() increment.
+        """
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in MAINTAINED_CAR_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def primary_image(self):
+        """The image flagged as primary, falling back to the first upload"""
+        images = getattr(self, 'primary_images', None)
+        if images is None:
+            images = self.images.order_by('-is_primary', 'id')[:1]
+        return next(iter(images), None)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    @property
+    def total_bookings(self):
+        return sum(getattr(self, field) for field in BOOKING_STATUS_COUNTERS.values())
+
+    @classmethod
+    def counter_expressions(cls):
+        """Subquery expressions recomputing every counter from Review and Booking"""
+        def total(queryset, aggregate):
+            queryset = queryset.filter(car=OuterRef('pk')).order_by().values('car')
+            return Coalesce(Subquery(queryset.annotate(value=aggregate).values('value')), Value(0))
+
+        expressions = {
+            'review_count': total(Review.objects.all(), Count('id')),
+            'rating_sum': total(Review.objects.all(), Sum('rating')),
+        }
+        for status, field in BOOKING_STATUS_COUNTERS.items():
+            expressions[field] = total(Booking.objects.filter(status=status), Count('id'))
+        return expressions
+
+def adjust_car_counters(car_id, touch=False, **deltas):
+    """Apply counter deltas to a car with a single UPDATE"""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if touch:
+        changes['updated_at'] = timezone.now()
+    if changes:
+        Car.objects.filter(pk=car_id).update(**changes)
+
+# Booking statuses whose days count as used (and earned) in CarDailyRollup
+ROLLUP_STATUSES = ('C', 'A', 'CO')
+ROLLUP_FIELDS = ('car_id', 'status', 'start_date', 'end_date', 'total_cost')
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('P', 'Pending'),
@@ -104,9 +209,49 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            # A user's bookings by date, for the dashboard
+            models.Index(fields=['user', 'start_date']),
+            # Admin date hierarchy
+            models.Index(fields=['start_date']),
+        ]
+
     def __str__(self):
         return f"Booking {self.id} - {self.car} by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'car_id' in field_names and 'status' in field_names:
+            instance._counted = (instance.car_id, instance.status)
+        if all(field in field_names for field in ROLLUP_FIELDS):
+            instance._rolled_up = instance.rollup_state()
+        return instance
+
+    def rollup_state(self):
+        return tuple(getattr(self, field) for field in ROLLUP_FIELDS)
+
+    def save(self, *args, **kwargs):
+        """Save and move this booking between its car's status counters and daily rollups"""
+        current = (self.car_id, self.status)
+        current_rollup = self.rollup_state()
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = getattr(self, '_counted', None)
+            previous_rollup = getattr(self, '_rolled_up', None)
+            if (previous is None or previous_rollup is None) and not self._state.adding:
+                previous_rollup = type(self).objects.filter(pk=self.pk).values_list(*ROLLUP_FIELDS).first()
+                previous = previous_rollup[:2] if previous_rollup is not None else None
+            super().save(*args, **kwargs)
+            if previous != current:
+                if previous is not None:
+                    adjust_car_counters(previous[0], **{BOOKING_STATUS_COUNTERS[previous[1]]: -1})
+                adjust_car_counters(self.car_id, **{BOOKING_STATUS_COUNTERS[self.status]: 1})
+            move_booking_rollups(previous_rollup, current_rollup)
+        self._counted = current
+        self._rolled_up = current_rollup
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
@@ -116,6 +261,113 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ('user', 'car')
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            # Keyset pages of one car's reviews
+            models.Index(fields=['car', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Review for {self.car} by {self.user.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'car_id' in field_names and 'rating' in field_names:
+            instance._counted = (instance.car_id, instance.rating)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save and keep the car's review count and rating sum in step"""
+        current = (self.car_id, self.rating)
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = getattr(self, '_counted', None)
+            if previous is None and not self._state.adding:
+                previous = type(self).objects.filter(pk=self.pk).values_list('car_id', 'rating').first()
+            super().save(*args, **kwargs)
+            if previous != current:
+                if previous is not None:
+                    adjust_car_counters(previous[0], touch=True, review_count=-1, rating_sum=-previous[1])
+                adjust_car_counters(self.car_id, touch=True, review_count=1, rating_sum=self.rating)
+        self._counted = current
+
+class CarDailyRollup(models.Model):
+    """Bookings and revenue of one car on one day.
+
+    Kept current by Booking.save, the booking delete signal and the batch
+    endpoint; `python manage.py backfill_rollups` rebuilds it. A booking's
+    total is spread evenly over its days.
+    """
+    car = models.ForeignKey(Car, related_name='daily_rollups', on_delete=models.CASCADE, db_index=False)
+    # Copy of the car's category, so a category change can be moved between CategoryDailyRollup rows
+    category = models.ForeignKey(CarCategory, on_delete=models.SET_NULL, null=True, db_index=False)
+    day = models.DateField()
+    # Bookings covering the day, normally 0 or 1
+    booked = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['car', 'day'], name='cars_rollup_car_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"Car {self.car_id} on {self.day}"
+
+class CategoryDailyRollup(models.Model):
+    """CarDailyRollup summed over the cars of one category"""
+    category = models.ForeignKey(CarCategory, related_name='daily_rollups', on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    # Booked car-days
+    booked = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'day'], name='cars_rollup_category_day'),
+        ]
+
+    def __str__(self):
+        return f"Category {self.category_id} on {self.day}"
+
+def split_cents(total_cost, days):
+    """Spread a booking's total over its days: (cents per day, days getting one cent more)"""
+    return divmod(round(Decimal(str(total_cost)) * 100), days)
+
+def adjust_daily_rollups(car_id, start_date, end_date, total_cost, sign):
+    """Add (sign=1) or remove (sign=-1) one booking's days and revenue"""
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return
+    share, remainder = split_cents(total_cost, days)
+    category_id = Car.objects.filter(pk=car_id).values_list('category_id', flat=True).first()
+    targets = [(CarDailyRollup, {'car_id': car_id}, {'category_id': category_id})]
+    if category_id is not None:
+        targets.append((CategoryDailyRollup, {'category_id': category_id}, {}))
+
+    for model, key, defaults in targets:
+        if sign > 0:
+            model.objects.bulk_create(
+                [model(day=start_date + timedelta(days=offset), **key, **defaults) for offset in range(days)],
+                ignore_conflicts=True,
+            )
+        rows = model.objects.filter(day__range=(start_date, end_date), **key)
+        rows.update(booked=F('booked') + sign, revenue=F('revenue') + Decimal(sign * share) / 100)
+        if remainder:
+            rows.filter(day__lt=start_date + timedelta(days=remainder)).update(
+                revenue=F('revenue') + Decimal(sign) / 100
+            )
+        if sign < 0:
+            rows.filter(booked__lte=0).delete()
+
+def move_booking_rollups(previous, current):
+    """Apply a booking changing from one ROLLUP_FIELDS state to another; either may be None"""
+    if previous == current:
+        return
+    if previous is not None and previous[1] in ROLLUP_STATUSES:
+        adjust_daily_rollups(previous[0], *previous[2:], sign=-1)
+    if current is not None and current[1] in ROLLUP_STATUSES:
+        adjust_daily_rollups(current[0], *current[2:], sign=1)
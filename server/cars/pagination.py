@@ -0,0 +1,173 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on (ordering field, id).
+
+    Each page is a single indexed range scan: no COUNT(*) and no OFFSET, so
+    deep pages cost the same as the first one. The key field comes from the
+    `ordering` parameter when the view lists it in `cursor_ordering_fields`,
+    otherwise from the view's `cursor_default_ordering`.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def get_key(self, request, view):
+        allowed = getattr(view, 'cursor_ordering_fields', ())
+        ordering = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if ordering.lstrip('-') not in allowed:
+            ordering = getattr(view, 'cursor_default_ordering', 'id')
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, fetching with the async ORM"""
+        return self.set_page([row async for row in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        """Return the query for the requested page plus one row to detect more."""
+        self.request = request
+        self.field, self.descending = self.get_key(request, view)
+        self.base_url = request.build_absolute_uri()
+        model_field = queryset.model._meta.get_field(self.field)
+        position = self.decode_cursor(request, model_field)
+
+        reverse = position is not None and position['reverse']
+        descending = self.descending != reverse
+        direction = '-' if descending else ''
+        if self.field == 'id':
+            queryset = queryset.order_by(f'{direction}id')
+        else:
+            queryset = queryset.order_by(f'{direction}{self.field}', f'{direction}id')
+
+        if position is not None:
+            lookup = 'lt' if descending else 'gt'
+            if self.field == 'id':
+                queryset = queryset.filter(**{f'id__{lookup}': position['id']})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__{lookup}': position['value']})
+                    | Q(**{self.field: position['value'], f'id__{lookup}': position['id']})
+                )
+
+        self.position = position
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        position = self.position
+        reverse = position is not None and position['reverse']
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field)
+        payload = {'id': instance.pk, 'reverse': reverse}
+        if self.field != 'id':
+            payload['value'] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model_field):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            position = {'id': int(payload['id']), 'reverse': bool(payload['reverse'])}
+            if self.field != 'id':
+                position['value'] = model_field.to_python(payload['value'])
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound('Invalid cursor')
+        return position
+
+
+class PageNumberOrCursorPagination(PageNumberPagination):
+    """Page numbers by default; `?pagination=cursor` switches to keyset pages."""
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, counting and fetching with the async ORM"""
+        self.keyset = None
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Filled in here so the paginator never runs its own COUNT query
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * page_size
+        rows = [row async for row in queryset[bottom:bottom + page_size]]
+        self.page = paginator._get_page(rows, number, paginator)
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
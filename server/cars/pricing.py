@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+import numpy as np
+
+# Saturday and Sunday are charged at a car's weekend_rate when it has one
+WEEKDAY_MASK = '1111100'
+
+
+def to_cents(rates):
+    return np.array([int((Decimal(rate) * 100).to_integral_value()) for rate in rates], dtype=np.int64)
+
+
+def day_split(start_dates, end_dates):
+    """Return (weekday counts, weekend day counts) for inclusive date ranges.
+
+    Accepts single dates or sequences of dates and works element-wise.
+    """
+    starts = np.asarray(start_dates, dtype='datetime64[D]')
+    ends = np.asarray(end_dates, dtype='datetime64[D]') + np.timedelta64(1, 'D')
+    weekdays = np.busday_count(starts, ends, weekmask=WEEKDAY_MASK)
+    weekend_days = (ends - starts).astype(np.int64) - weekdays
+    return weekdays, weekend_days
+
+
+def quote_totals(daily_rates, weekend_rates, start_dates, end_dates):
+    """Price many bookings at once, in whole cents.
+
+    `daily_rates` and `weekend_rates` are parallel sequences (a missing
+    weekend rate falls back to the daily rate); the dates are either single
+    dates shared by every car or sequences of the same length.
+    """
+    daily = to_cents(daily_rates)
+    weekend = to_cents(
+        weekend if weekend is not None else daily_rate
+        for daily_rate, weekend in zip(daily_rates, weekend_rates)
+    )
+    weekdays, weekend_days = day_split(start_dates, end_dates)
+    return daily * weekdays + weekend * weekend_days
+
+
+def cents_to_decimal(cents):
+    return (Decimal(int(cents)) / 100).quantize(Decimal('0.01'))
+
+
+def booking_total(car, start_date, end_date):
+    """Total cost of booking `car` from start_date to end_date inclusive."""
+    cents = quote_totals([car.daily_rate], [car.weekend_rate], start_date, end_date)
+    return cents_to_decimal(cents[0])
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .generations import bump_generation, current_generations
+from .models import Review
+
+RATINGS = range(1, 6)
+
+
+def histogram_generation_key(car_id):
+    return f'cars:reviews:{car_id}'
+
+
+def reviews_changed(car_ids):
+    """Invalidate the cached rating histograms of these cars."""
+    for car_id in set(car_ids):
+        bump_generation(histogram_generation_key(car_id))
+
+
+def rating_histogram(car_id):
+    """Number of reviews of a car per star rating, {'1': count, ..., '5': count}.
+
+    Cached until one of the car's reviews is written or deleted.
+    """
+    generation_key = histogram_generation_key(car_id)
+    generation = current_generations([generation_key])[generation_key]
+    key = f'cars:reviews:{car_id}:histogram:{generation}'
+    histogram = cache.get(key)
+    if histogram is None:
+        counts = dict(
+            Review.objects.filter(car_id=car_id).values_list('rating').annotate(count=Count('pk')).order_by()
+        )
+        histogram = {str(rating): counts.get(rating, 0) for rating in RATINGS}
+        cache.set(key, histogram, getattr(settings, 'REVIEW_HISTOGRAM_CACHE_TIMEOUT', 3600))
+    return histogram
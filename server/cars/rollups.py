@@ -0,0 +1,182 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from .bulk import batched, insert_rows
+from .models import ROLLUP_STATUSES, Booking, Car, CarDailyRollup, CategoryDailyRollup
+
+ROLLUP_INTERVALS = ('total', 'month', 'day')
+
+
+def expand_bookings(bookings, first_day=None, last_day=None):
+    """Split bookings into per-day entries with NumPy.
+
+    `bookings` is a list of (car_id, start_date, end_date, total_cost). Returns
+    parallel arrays (car ids, days, revenue in cents), one entry per booked day
+    inside first_day..last_day. Totals are spread like adjust_daily_rollups:
+    evenly, with the leftover cents on the first days.
+    """
+    car_ids, starts, ends, totals = zip(*bookings)
+    starts = np.array(starts, dtype='datetime64[D]')
+    lengths = (np.array(ends, dtype='datetime64[D]') - starts).astype(np.int64) + 1
+    lengths = np.maximum(lengths, 0)
+    cents = np.array([round(Decimal(str(total)) * 100) for total in totals], dtype=np.int64)
+    share, remainder = np.divmod(cents, np.maximum(lengths, 1))
+
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    days = np.repeat(starts, lengths) + offsets
+    revenue = np.repeat(share, lengths) + (offsets < np.repeat(remainder, lengths))
+    cars = np.repeat(np.array(car_ids, dtype=np.int64), lengths)
+
+    keep = np.ones(len(days), dtype=bool)
+    if first_day is not None:
+        keep &= days >= np.datetime64(first_day, 'D')
+    if last_day is not None:
+        keep &= days <= np.datetime64(last_day, 'D')
+    return cars[keep], days[keep], revenue[keep]
+
+
+def sum_by(keys, days, revenue):
+    """Sum entries sharing a (key, day) pair: unique keys, days, counts and revenue"""
+    pairs, inverse = np.unique(np.column_stack([keys, days.astype(np.int64)]), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    booked = np.bincount(inverse, minlength=len(pairs))
+    cents = np.bincount(inverse, weights=revenue, minlength=len(pairs)).round().astype(np.int64)
+    return pairs[:, 0], pairs[:, 1].astype('datetime64[D]'), booked, cents
+
+
+def rollup_values(keys, days, booked, cents):
+    return zip(
+        keys.tolist(),
+        days.astype(object),
+        booked.tolist(),
+        (Decimal(value) / 100 for value in cents.tolist()),
+    )
+
+
+def rebuild_rollups(first_day=None, last_day=None, batch_size=500):
+    """Recompute both rollup tables from the bookings, optionally for a date window.
+
+    Cars are processed `batch_size` at a time, each batch in its own
+    transaction; category totals are accumulated across batches and written
+    at the end. Returns the number of car-day rows written.
+    """
+    window = {}
+    if first_day is not None:
+        window['day__gte'] = first_day
+    if last_day is not None:
+        window['day__lte'] = last_day
+    bookings = Booking.objects.filter(status__in=ROLLUP_STATUSES)
+    if first_day is not None:
+        bookings = bookings.filter(end_date__gte=first_day)
+    if last_day is not None:
+        bookings = bookings.filter(start_date__lte=last_day)
+
+    categories = dict(Car.objects.values_list('id', 'category_id'))
+    category_entries = []
+    written = 0
+    for car_ids in batched(sorted(categories), batch_size):
+        rows = list(bookings.filter(car_id__in=car_ids).values_list('car_id', 'start_date', 'end_date', 'total_cost'))
+        with transaction.atomic():
+            CarDailyRollup.objects.filter(car_id__in=car_ids, **window).delete()
+            if not rows:
+                continue
+            cars, days, revenue = expand_bookings(rows, first_day, last_day)
+            if not len(cars):
+                continue
+            car_keys, car_days, booked, cents = sum_by(cars, days, revenue)
+            written += insert_rows(
+                CarDailyRollup,
+                ['car', 'category', 'day', 'booked', 'revenue'],
+                (
+                    (car_id, categories[car_id], day, count, amount)
+                    for car_id, day, count, amount in rollup_values(car_keys, car_days, booked, cents)
+                ),
+            )
+        category_ids = np.array([categories[car_id] or 0 for car_id in car_keys.tolist()], dtype=np.int64)
+        has_category = category_ids > 0
+        category_entries.append(
+            (category_ids[has_category], car_days[has_category], booked[has_category], cents[has_category])
+        )
+
+    with transaction.atomic():
+        CategoryDailyRollup.objects.filter(**window).delete()
+        if category_entries:
+            keys, days, booked, cents = (np.concatenate(parts) for parts in zip(*category_entries))
+            pairs, inverse = np.unique(np.column_stack([keys, days.astype(np.int64)]), axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            insert_rows(
+                CategoryDailyRollup,
+                ['category', 'day', 'booked', 'revenue'],
+                rollup_values(
+                    pairs[:, 0],
+                    pairs[:, 1].astype('datetime64[D]'),
+                    np.bincount(inverse, weights=booked, minlength=len(pairs)).astype(np.int64),
+                    np.bincount(inverse, weights=cents, minlength=len(pairs)).round().astype(np.int64),
+                ),
+            )
+    return written
+
+
+def rebuild_category_rollups(category_ids):
+    """Recompute CategoryDailyRollup for some categories from CarDailyRollup"""
+    category_ids = [category_id for category_id in category_ids if category_id is not None]
+    if not category_ids:
+        return
+    with transaction.atomic():
+        CategoryDailyRollup.objects.filter(category_id__in=category_ids).delete()
+        CategoryDailyRollup.objects.bulk_create(
+            [
+                CategoryDailyRollup(**values)
+                for values in CarDailyRollup.objects.filter(category_id__in=category_ids)
+                .values('category_id', 'day').annotate(booked=Sum('booked'), revenue=Sum('revenue'))
+                .order_by()
+            ],
+            batch_size=2000,
+        )
+
+
+def period_days(period, interval, first_day, last_day):
+    """Days of first_day..last_day falling in the period starting on `period`"""
+    if interval == 'day':
+        return 1
+    if interval == 'total':
+        return (last_day - first_day).days + 1
+    next_month = (period.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return (min(next_month - timedelta(days=1), last_day) - max(period, first_day)).days + 1
+
+
+def rollup_report(queryset, group_by, first_day, last_day, interval, cars):
+    """Booked days, utilization and revenue from a rollup queryset.
+
+    `group_by` lists extra fields to report separately (e.g. category_id) and
+    `cars` maps each group to its fleet size, the utilization denominator.
+    """
+    queryset = queryset.filter(day__gte=first_day, day__lte=last_day)
+    fields = list(group_by)
+    if interval == 'month':
+        queryset = queryset.annotate(period=TruncMonth('day'))
+        fields.append('period')
+    elif interval == 'day':
+        fields.append('day')
+    rows = queryset.values(*fields).annotate(booked_days=Sum('booked'), total_revenue=Sum('revenue')).order_by(*fields)
+
+    report = []
+    for row in rows:
+        # Months are reported from their first day inside the range
+        period = max(row.get('period') or row.get('day') or first_day, first_day)
+        group = tuple(row[field] for field in group_by)
+        capacity = cars.get(group, 0) * period_days(period, interval, first_day, last_day)
+        entry = {field: row[field] for field in group_by}
+        entry.update({
+            'period': period,
+            'booked_days': row['booked_days'],
+            'utilization': round(row['booked_days'] / capacity, 4) if capacity else None,
+            'revenue': str(Decimal(row['total_revenue']).quantize(Decimal('0.01'))),
+        })
+        report.append(entry)
+    return report
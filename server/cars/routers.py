@@ -0,0 +1,44 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Replica alias chosen for the request being handled, None to use the primary.
+# Set by ReplicaRoutingMiddleware; code outside a request always reads the primary.
+replica_alias = ContextVar('replica_alias', default=None)
+
+# Catalogue data that may be read with a little replication lag. Bookings,
+# users and sessions always come from the primary.
+REPLICA_MODELS = {
+    'cars.car', 'cars.car_features', 'cars.carcategory', 'cars.carfeature',
+    'cars.carimage', 'cars.review',
+}
+
+
+def choose_replica():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    return random.choice(replicas) if replicas else None
+
+
+class ReadReplicaRouter:
+    """Send catalogue reads of safe-method requests to a read replica.
+
+    Replicas are aliases in DATABASES listed in DATABASE_REPLICAS. With none
+    listed every query goes to 'default'. For local testing a copy of a
+    SQLite database can stand in for a replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias.get()
+        if alias is not None and model._meta.label_lower in REPLICA_MODELS:
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
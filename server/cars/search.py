@@ -0,0 +1,76 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Func, IntegerField, Q
+from rest_framework import filters
+
+SEARCH_CONFIG = 'english'
+
+# Rebuilds Car.search_vector from the car, its category and its features.
+# Make and model rank highest, then year and category, then the free text.
+UPDATE_SEARCH_VECTOR_SQL = f"""
+    UPDATE cars_car SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', concat_ws(' ', make, model)), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', concat_ws(' ', year::text, (
+            SELECT name FROM cars_carcategory WHERE id = cars_car.category_id
+        ))), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', concat_ws(' ', description, (
+            SELECT string_agg(feature.name, ' ')
+            FROM cars_car_features link
+            JOIN cars_carfeature feature ON feature.id = link.carfeature_id
+            WHERE link.car_id = cars_car.id
+        ))), 'C')
+"""
+
+
+def full_text_search_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(car_ids=None):
+    """Refresh the search vector of the given cars, or of every car."""
+    if not full_text_search_enabled():
+        return
+    with connection.cursor() as cursor:
+        if car_ids is None:
+            cursor.execute(UPDATE_SEARCH_VECTOR_SQL)
+        else:
+            car_ids = list(car_ids)
+            if car_ids:
+                cursor.execute(UPDATE_SEARCH_VECTOR_SQL + ' WHERE id = ANY(%s)', [car_ids])
+
+
+def prefix_query(text):
+    """Turn free text into a tsquery matching every word as a prefix."""
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    return SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        search_type='raw',
+        config=SEARCH_CONFIG,
+    )
+
+
+class CarSearchFilter(filters.SearchFilter):
+    """Ranked full-text search over Car.search_vector on PostgreSQL.
+
+    Other databases fall back to DRF's `icontains` search over the view's
+    `search_fields`, so the `?search=` parameter behaves the same everywhere.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not full_text_search_enabled():
+            return super().filter_queryset(request, queryset, view)
+
+        query = prefix_query(request.query_params.get(self.search_param, ''))
+        if query is None:
+            return queryset
+        # Stopwords are dropped, so text like "the" leaves an empty tsquery that
+        # matches nothing; treat it like no search at all.
+        # An explicit ?ordering= is applied afterwards by OrderingFilter
+        return queryset.annotate(
+            search_terms=Func(query, function='numnode', output_field=IntegerField()),
+            search_rank=SearchRank(F('search_vector'), query),
+        ).filter(Q(search_vector=query) | Q(search_terms=0)).order_by('-search_rank', 'id')
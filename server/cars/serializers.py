@@ -1,28 +1,158 @@
+from time import perf_counter
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from .bookings import change_booking_dates, create_booking
+from .images import derivative_urls
+from .metrics import current_timings
 from .models import Car, CarCategory, CarFeature, CarImage, Booking, Review
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_tree(value):
+    """Turn 'id,car.make,car.model' into {'id': {}, 'car': {'make': {}, 'model': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+class DynamicFieldsMixin:
+    """Serializer whose output can be trimmed with `fields` and grown with `expand`.
+
+    Both are read from the `?fields=` / `?expand=` query parameters (dotted
+    names reach into nested serializers) or passed as keyword arguments.
+    `Meta.default_fields` limits what is sent when `fields` is not given, and
+    `Meta.select_related_fields` / `Meta.prefetch_related_fields` map fields to
+    the relations they need, so `optimize_queryset` only loads what is rendered.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        if fields is not None or expand is not None:
+            self._field_trees = (
+                parse_field_tree(','.join(fields)) if fields is not None else None,
+                parse_field_tree(','.join(expand or ())),
+            )
+        super().__init__(*args, **kwargs)
+
+    def _requested_fields(self):
+        path = []
+        node = self
+        while node is not None:
+            trees = getattr(node, '_field_trees', None)
+            if trees is not None:
+                break
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        else:
+            request = self.context.get('request')
+            params = getattr(request, 'query_params', getattr(request, 'GET', {}))
+            fields = params.get('fields')
+            trees = (parse_field_tree(fields) if fields else None, parse_field_tree(params.get('expand')))
+
+        only, expand = trees
+        for name in reversed(path):
+            only = (only.get(name) or None) if only is not None else None
+            expand = expand.get(name, {})
+        return only, expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self._requested_fields()
+        if only is None:
+            default_fields = getattr(self.Meta, 'default_fields', None)
+            if default_fields is None:
+                return fields
+            only = set(default_fields) | set(expand)
+        # Trimming only shapes the output; input fields stay when writing
+        writing = hasattr(self.root, 'initial_data')
+        return {
+            name: field for name, field in fields.items()
+            if name in only or field.write_only or (writing and not field.read_only)
+        }
+
+    def to_representation(self, instance):
+        timings = current_timings()
+        parent = self.parent
+        # Only the outermost serializer is timed; nested ones run inside it
+        if timings is None or not (
+            parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+        ):
+            return super().to_representation(instance)
+        started = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serialize += perf_counter() - started
+
+    def related_lookups(self, prefix='', prefetched=False):
+        """Return the select_related and prefetch_related lookups for the rendered fields."""
+        select, prefetch = [], []
+        selects = getattr(self.Meta, 'select_related_fields', {})
+        prefetches = getattr(self.Meta, 'prefetch_related_fields', {})
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in selects:
+                lookup, is_prefetch = selects[name], prefetched
+            elif name in prefetches:
+                lookup, is_prefetch = prefetches[name], True
+            else:
+                continue
+            if callable(lookup):
+                prefetch.append(lookup(prefix))
+                continue
+            (prefetch if is_prefetch else select).append(prefix + lookup)
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, DynamicFieldsMixin):
+                nested_select, nested_prefetch = nested.related_lookups(f'{prefix}{lookup}__', is_prefetch)
+                select += nested_select
+                prefetch += nested_prefetch
+        return select, prefetch
+
+    def optimize_queryset(self, queryset):
+        select, prefetch = self.related_lookups()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+def primary_image_prefetch(prefix):
+    return Prefetch(
+        f'{prefix}images',
+        queryset=CarImage.objects.order_by('-is_primary', 'id')[:1],
+        to_attr='primary_images'
+    )
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
 
-class CarCategorySerializer(serializers.ModelSerializer):
+class CarCategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CarCategory
         fields = '__all__'
 
-class CarFeatureSerializer(serializers.ModelSerializer):
+class CarFeatureSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CarFeature
         fields = '__all__'
 
-class CarImageSerializer(serializers.ModelSerializer):
+class CarImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    derivatives = serializers.SerializerMethodField()
+
     class Meta:
         model = CarImage
-        fields = ('id', 'image', 'is_primary', 'caption')
+        fields = ('id', 'image', 'is_primary', 'caption', 'derivatives')
+
+    def get_derivatives(self, obj):
+        """thumbnail / medium / large URLs in JPEG and WebP; empty until generated"""
+        return derivative_urls(obj, self.context.get('request'))
 
-class CarSerializer(serializers.ModelSerializer):
+class CarSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = CarCategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=CarCategory.objects.all(),
@@ -39,12 +169,60 @@ class CarSerializer(serializers.ModelSerializer):
         required=False
     )
     images = CarImageSerializer(many=True, read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Car
-        fields = '__all__'
+        exclude = (
+            'search_vector', 'rating_sum', 'pending_bookings', 'confirmed_bookings',
+            'active_bookings', 'completed_bookings', 'cancelled_bookings',
+        )
+        select_related_fields = {'category': 'category'}
+        prefetch_related_fields = {
+            'features': 'features',
+            'images': 'images',
+            'primary_image': primary_image_prefetch,
+        }
 
-class BookingSerializer(serializers.ModelSerializer):
+class CarListSerializer(CarSerializer):
+    """Compact car representation for grids; other fields can be added with `expand`"""
+    primary_image = CarImageSerializer(read_only=True)
+
+    class Meta(CarSerializer.Meta):
+        default_fields = (
+            'id', 'make', 'model', 'year', 'daily_rate', 'primary_image',
+            'average_rating', 'review_count',
+        )
+
+class CarSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Just enough of a car to label a booking"""
+    thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Car
+        fields = ('id', 'make', 'model', 'year', 'license_plate', 'thumbnail')
+        prefetch_related_fields = {'thumbnail': primary_image_prefetch}
+
+    def get_thumbnail(self, car):
+        """JPEG thumbnail of the primary image, the original until it is rendered"""
+        image = car.primary_image
+        if image is None:
+            return None
+        request = self.context.get('request')
+        thumbnail = derivative_urls(image, request).get('thumbnail')
+        if thumbnail:
+            return thumbnail['jpeg']
+        return request.build_absolute_uri(image.image.url) if request is not None else image.image.url
+
+class DashboardBookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    car = CarSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Booking
+        fields = ('id', 'car', 'start_date', 'end_date', 'total_cost', 'status', 'created_at')
+        select_related_fields = {'car': 'car'}
+
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     car = CarSerializer(read_only=True)
     car_id = serializers.IntegerField(write_only=True)
@@ -54,26 +232,72 @@ class BookingSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'car', 'car_id', 'start_date', 'end_date', 
                  'total_cost', 'status', 'created_at', 'updated_at')
         read_only_fields = ('total_cost', 'status', 'created_at', 'updated_at')
+        select_related_fields = {'user': 'user', 'car': 'car'}
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if start_date and end_date and end_date < start_date:
+            raise serializers.ValidationError({"end_date": "end_date cannot be before start_date"})
+        if self.instance is not None and attrs.get('car_id', self.instance.car_id) != self.instance.car_id:
+            raise serializers.ValidationError({"car_id": "A booking cannot be moved to another car"})
+        return attrs
 
     def create(self, validated_data):
-        # Calculate total cost based on number of days and car's daily rate
-        car = Car.objects.get(id=validated_data['car_id'])
-        start_date = validated_data['start_date']
-        end_date = validated_data['end_date']
-        days = (end_date - start_date).days + 1
-        total_cost = car.daily_rate * days
-
-        booking = Booking.objects.create(
-            user=self.context['request'].user,
-            car=car,
-            start_date=start_date,
-            end_date=end_date,
-            total_cost=total_cost,
-            status='P'  # Default status is Pending
+        # Locks the car, rejects overlapping dates and prices the booking
+        return create_booking(
+            self.context['request'].user,
+            validated_data['car_id'],
+            validated_data['start_date'],
+            validated_data['end_date'],
         )
-        return booking
 
-class ReviewSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # Dates are the only writable fields; they go through the same checks as create
+        start_date = validated_data.get('start_date', instance.start_date)
+        end_date = validated_data.get('end_date', instance.end_date)
+        if (start_date, end_date) == (instance.start_date, instance.end_date):
+            return instance
+        return change_booking_dates(instance, start_date, end_date)
+
+class BookingOperationSerializer(serializers.Serializer):
+    """One item of a batch booking request"""
+    REQUIRED_FIELDS = {
+        'create': ('car_id', 'start_date', 'end_date'),
+        'cancel': ('id',),
+        'status': ('id', 'status'),
+    }
+
+    op = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    id = serializers.IntegerField(required=False)
+    car_id = serializers.IntegerField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES, required=False)
+
+    def validate(self, attrs):
+        missing = [name for name in self.REQUIRED_FIELDS[attrs['op']] if name not in attrs]
+        if missing:
+            raise serializers.ValidationError({name: "This field is required." for name in missing})
+        if attrs['op'] == 'create' and attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError({"end_date": "end_date cannot be before start_date"})
+        return attrs
+
+class ReviewAuthorSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
+class CarReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """A review listed under its car: no nested car and only the author's name"""
+    user = ReviewAuthorSerializer(read_only=True)
+
+    class Meta:
+        model = Review
+        fields = ('id', 'user', 'rating', 'comment', 'created_at')
+        select_related_fields = {'user': 'user'}
+
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     car = CarSerializer(read_only=True)
     car_id = serializers.IntegerField(write_only=True)
@@ -82,6 +306,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ('id', 'user', 'car', 'car_id', 'rating', 'comment', 'created_at')
         read_only_fields = ('created_at',)
+        select_related_fields = {'user': 'user', 'car': 'car'}
 
     def create(self, validated_data):
         review = Review.objects.create(
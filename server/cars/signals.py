@@ -0,0 +1,173 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .availability import availability_index
+from .calendar import calendars_changed
+from .generations import CATALOGUE_GENERATION_KEY, bump_generation
+from .images import delete_derivatives, schedule_derivatives
+from .metrics import install_query_timer
+from .models import (
+    BOOKING_STATUS_COUNTERS, Booking, Car, CarCategory, CarDailyRollup, CarFeature, CarImage, Review,
+    adjust_car_counters, move_booking_rollups,
+)
+from .reviews import reviews_changed
+from .rollups import rebuild_category_rollups
+from .search import full_text_search_enabled, update_search_vectors
+from .similarity import similarity_index
+
+
+def bookings_written(bookings):
+    """Pass saved bookings on to the availability index, facet and calendar caches after commit.
+
+    Bulk writes skip post_save, so code using bulk_create / bulk_update calls
+    this directly.
+    """
+    written = [
+        (booking.id, booking.car_id, booking.start_date, booking.end_date, booking.status)
+        for booking in bookings
+    ]
+
+    def apply():
+        availability_index.bookings_written(updates=written)
+        calendars_changed(values[1] for values in written)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, **kwargs):
+    """Keep the availability index in step with booking writes."""
+    bookings_written([instance])
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    adjust_car_counters(instance.car_id, **{BOOKING_STATUS_COUNTERS[instance.status]: -1})
+    move_booking_rollups(getattr(instance, '_rolled_up', None) or instance.rollup_state(), None)
+    booking_id, car_id = instance.id, instance.car_id
+
+    def apply():
+        availability_index.bookings_written(deleted=[booking_id])
+        calendars_changed([car_id])
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """Runs inside the delete transaction, cascades included."""
+    adjust_car_counters(instance.car_id, touch=True, review_count=-1, rating_sum=-instance.rating)
+    car_id = instance.car_id
+    transaction.on_commit(lambda: reviews_changed([car_id]))
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    car_id = instance.car_id
+    transaction.on_commit(lambda: reviews_changed([car_id]))
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+@receiver(post_save, sender=CarCategory)
+@receiver(post_delete, sender=CarCategory)
+@receiver(post_save, sender=CarFeature)
+@receiver(post_delete, sender=CarFeature)
+@receiver(m2m_changed, sender=Car.features.through)
+def catalogue_changed(sender, **kwargs):
+    """Drop cached facet counts whenever the catalogue changes."""
+    transaction.on_commit(lambda: bump_generation(CATALOGUE_GENERATION_KEY))
+
+
+@receiver(m2m_changed, sender=Car.features.through)
+def car_features_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump updated_at and the search vector of the cars whose features changed."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_car_ids = list(instance.car_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    model = CarFeature if reverse else Car
+    model.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+    if not reverse:
+        car_ids = [instance.pk]
+    elif action == 'post_clear':
+        car_ids = getattr(instance, '_cleared_car_ids', [])
+    else:
+        car_ids = pk_set or []
+    update_search_vectors(car_ids)
+    car_ids = list(car_ids)
+    transaction.on_commit(lambda: similarity_index.update(car_ids))
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, created, **kwargs):
+    update_search_vectors([instance.pk])
+    car_id = instance.pk
+    transaction.on_commit(lambda: similarity_index.update([car_id]))
+    if not created:
+        # Move the car's days to its new category's rollups
+        moved = CarDailyRollup.objects.filter(car=instance).exclude(category_id=instance.category_id)
+        previous = set(moved.values_list('category_id', flat=True).distinct())
+        if previous:
+            moved.update(category_id=instance.category_id)
+            rebuild_category_rollups(previous | {instance.category_id})
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    car_id = instance.pk
+    transaction.on_commit(lambda: similarity_index.discard(car_id))
+
+
+@receiver(post_delete, sender=CarCategory)
+@receiver(post_delete, sender=CarFeature)
+def vector_column_deleted(sender, **kwargs):
+    """Cars lose a category or feature without a save or m2m signal; re-encode them all"""
+    transaction.on_commit(similarity_index.invalidate)
+
+
+@receiver(post_save, sender=CarCategory)
+def category_saved(sender, instance, created, **kwargs):
+    if full_text_search_enabled() and not created:
+        update_search_vectors(instance.car_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=CarFeature)
+def feature_saved(sender, instance, created, **kwargs):
+    if full_text_search_enabled() and not created:
+        update_search_vectors(instance.car_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=CarImage)
+def car_image_saved(sender, instance, **kwargs):
+    """Render derivatives in the background whenever a new original is stored."""
+    if instance.image and instance.image.name != getattr(instance, '_source_image', None):
+        schedule_derivatives(instance.pk)
+    instance._source_image = instance.image.name
+
+
+@receiver(post_delete, sender=CarImage)
+def car_image_deleted(sender, instance, **kwargs):
+    # A removed image no longer counts towards the car's Last-Modified; move the car's instead
+    Car.objects.filter(pk=instance.car_id).update(updated_at=timezone.now())
+    derivatives = instance.derivatives
+    transaction.on_commit(lambda: delete_derivatives(derivatives))
+
+
+@receiver(pre_delete, sender=CarFeature)
+def feature_deleting(sender, instance, **kwargs):
+    # Deleting a feature removes its car links without an m2m_changed signal
+    instance._car_ids = list(instance.car_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=CarFeature)
+def feature_deleted(sender, instance, **kwargs):
+    Car.objects.filter(pk__in=getattr(instance, '_car_ids', [])).update(updated_at=timezone.now())
+
+
+# Per-request query counts and times for PerformanceMetricsMiddleware
+connection_created.connect(install_query_timer)
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .models import Car, CarCategory, CarFeature
+
+# Weight of each attribute in the car vectors. One-hot attributes put their
+# weight in the matching column; numerics are z-scores times their weight.
+SIMILARITY_WEIGHTS = {
+    'category': 1.0,
+    'fuel_type': 0.5,
+    'transmission': 0.5,
+    'features': 0.5,
+    'seats': 0.5,
+    'daily_rate': 1.0,
+    'year': 0.5,
+}
+NUMERIC_FIELDS = ('seats', 'daily_rate', 'year')
+CAR_FIELDS = ('id', 'category_id', 'fuel_type', 'transmission', *NUMERIC_FIELDS, 'is_available')
+
+
+def load_cars(car_ids=None):
+    """CAR_FIELDS rows and {car_id: [feature ids]} for some cars, or all of them."""
+    cars = Car.objects.order_by('id')
+    links = Car.features.through.objects.all()
+    if car_ids is not None:
+        cars = cars.filter(pk__in=car_ids)
+        links = links.filter(car_id__in=car_ids)
+    features = defaultdict(list)
+    for car_id, feature_id in links.values_list('car_id', 'carfeature_id').iterator(chunk_size=5000):
+        features[car_id].append(feature_id)
+    return list(cars.values_list(*CAR_FIELDS)), features
+
+
+class VectorLayout:
+    """Column layout and numeric scaling of the car vectors, fixed when the index is built."""
+
+    def __init__(self, category_ids, feature_ids, numerics):
+        self.columns = {}
+        width = 0
+        for name, keys in (
+            ('category', category_ids),
+            ('fuel_type', [code for code, _ in Car.FUEL_CHOICES]),
+            ('transmission', [code for code, _ in Car.TRANSMISSION_CHOICES]),
+            ('features', feature_ids),
+        ):
+            self.columns[name] = {key: width + i for i, key in enumerate(keys)}
+            width += len(keys)
+        self.numeric_start = width
+        self.width = width + len(NUMERIC_FIELDS)
+
+        if len(numerics):
+            self.mean = numerics.mean(axis=0)
+            std = numerics.std(axis=0)
+        else:
+            self.mean = np.zeros(len(NUMERIC_FIELDS))
+            std = np.ones(len(NUMERIC_FIELDS))
+        std[std == 0] = 1
+        self.scale = np.array([SIMILARITY_WEIGHTS[name] for name in NUMERIC_FIELDS]) / std
+
+    def encode(self, cars, features, numerics, strict=True):
+        """One vector per CAR_FIELDS row.
+
+        With `strict`, returns None if a row uses a category or feature the
+        layout has no column for; otherwise those are left out.
+        """
+        matrix = np.zeros((len(cars), self.width), dtype=np.float32)
+        for row, (car_id, category_id, fuel_type, transmission, *_) in enumerate(cars):
+            for name, key in (('category', category_id), ('fuel_type', fuel_type), ('transmission', transmission)):
+                if key is None:
+                    continue
+                column = self.columns[name].get(key)
+                if column is None:
+                    if strict:
+                        return None
+                    continue
+                matrix[row, column] = SIMILARITY_WEIGHTS[name]
+            for feature_id in features.get(car_id, ()):
+                column = self.columns['features'].get(feature_id)
+                if column is None:
+                    if strict:
+                        return None
+                    continue
+                matrix[row, column] = SIMILARITY_WEIGHTS['features']
+        if len(cars):
+            matrix[:, self.numeric_start:] = (numerics - self.mean) * self.scale
+        return matrix
+
+
+def numeric_values(cars):
+    return np.array([car[4:4 + len(NUMERIC_FIELDS)] for car in cars], dtype=np.float64).reshape(-1, len(NUMERIC_FIELDS))
+
+
+class SimilarityIndex:
+    """Process-local NumPy matrix of car vectors for nearest-neighbour lookups.
+
+    Each car is one row: one-hot category, fuel type and transmission, its
+    features, and z-scored seats, daily rate and year, weighted by
+    SIMILARITY_WEIGHTS. Similar cars are the rows nearest in Euclidean
+    distance. The matrix is built on first use, kept current by the Car
+    signal handlers in ``cars.signals`` and rebuilt after
+    ``SIMILARITY_INDEX_TTL`` seconds to pick up other processes' writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._layout = None
+        self._rows = {}
+        self._ids = np.empty(0, dtype=np.int64)
+        self._rentable = np.empty(0, dtype=bool)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+
+    def rebuild(self):
+        """Encode every car from the database."""
+        cars, features = load_cars()
+        numerics = numeric_values(cars)
+        layout = VectorLayout(
+            list(CarCategory.objects.order_by('id').values_list('id', flat=True)),
+            list(CarFeature.objects.order_by('id').values_list('id', flat=True)),
+            numerics,
+        )
+        # Only a category or feature deleted since load_cars() can be missing a column
+        matrix = layout.encode(cars, features, numerics, strict=False)
+        with self._lock:
+            self._layout = layout
+            self._matrix = matrix
+            self._ids = np.array([car[0] for car in cars], dtype=np.int64)
+            self._rentable = np.array([car[-1] for car in cars], dtype=bool)
+            self._rows = {car[0]: row for row, car in enumerate(cars)}
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def ensure_loaded(self):
+        ttl = getattr(settings, 'SIMILARITY_INDEX_TTL', 300)
+        with self._lock:
+            stale = self._built_at is None or (
+                ttl is not None and time.monotonic() - self._built_at > ttl
+            )
+            if stale:
+                self.rebuild()
+
+    def update(self, car_ids):
+        """Re-encode some cars after they were saved, deleted or had their features changed."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            layout = self._layout
+        cars, features = load_cars(car_ids)
+        matrix = layout.encode(cars, features, numeric_values(cars))
+        with self._lock:
+            if self._layout is not layout or self._built_at is None:
+                return
+            if matrix is None:
+                # A new category or feature needs more columns
+                self._built_at = None
+                return
+            added = []
+            for car, vector in zip(cars, matrix):
+                row = self._rows.get(car[0])
+                if row is None:
+                    added.append((car, vector))
+                else:
+                    self._matrix[row] = vector
+                    self._rentable[row] = car[-1]
+            if added:
+                self._rows.update({car[0]: len(self._ids) + i for i, (car, _) in enumerate(added)})
+                self._ids = np.concatenate([self._ids, [car[0] for car, _ in added]])
+                self._rentable = np.concatenate([self._rentable, [car[-1] for car, _ in added]])
+                self._matrix = np.vstack([self._matrix, [vector for _, vector in added]])
+            for car_id in set(car_ids) - {car[0] for car in cars}:
+                self._discard(car_id)
+
+    def discard(self, car_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._discard(car_id)
+
+    def _discard(self, car_id):
+        # The row stays in the matrix, unused, until the next rebuild
+        row = self._rows.pop(car_id, None)
+        if row is not None:
+            self._rentable[row] = False
+
+    def similar(self, car_id, count, exclude=()):
+        """Ids of the `count` available cars nearest to `car_id`, nearest first.
+
+        Cars in `exclude` are skipped. Returns None for a car not in the index.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            row = self._rows.get(car_id)
+            if row is None:
+                return None
+            distances = np.square(self._matrix - self._matrix[row]).sum(axis=1)
+            candidates = self._rentable.copy()
+            candidates[row] = False
+            if exclude:
+                candidates &= ~np.isin(self._ids, list(exclude))
+            ids = self._ids
+        distances[~candidates] = np.inf
+        count = min(count, int(candidates.sum()))
+        if count <= 0:
+            return []
+        nearest = np.argpartition(distances, count - 1)[:count]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return ids[nearest].tolist()
+
+
+similarity_index = SimilarityIndex()
@@ -1,3 +1,1183 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import re
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.http import http_date
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .admin import EstimatedCountPaginator
+from .availability import CarIntervals, availability_index
+from .bookings import BookingConflict, change_booking_dates, create_booking
+from .generations import BOOKING_GENERATION_KEY, bump_generation
+from .metrics import Histogram
+from .middleware import PRIMARY_COOKIE
+from .pricing import booking_total, quote_totals
+from .reviews import histogram_generation_key, rating_histogram
+from .similarity import similarity_index
+from .models import (
+    BOOKING_STATUS_COUNTERS, Booking, Car, CarCategory, CarDailyRollup, CarFeature, CarImage, CategoryDailyRollup,
+    Review,
+)
+
+
+def make_car(**fields):
+    values = {
+        'make': 'Toyota',
+        'model': 'Corolla',
+        'year': 2022,
+        'transmission': 'A',
+        'fuel_type': 'P',
+        'seats': 5,
+        'daily_rate': Decimal('40.00'),
+        'description': 'Test car',
+    }
+    values.update(fields)
+    return Car.objects.create(**values)
+
+
+class CarIntervalsTests(TestCase):
+    def test_overlaps_are_inclusive(self):
+        intervals = CarIntervals()
+        intervals.add(1, date(2030, 1, 10), date(2030, 1, 12))
+
+        self.assertTrue(intervals.overlaps(date(2030, 1, 12), date(2030, 1, 14)))
+        self.assertTrue(intervals.overlaps(date(2030, 1, 8), date(2030, 1, 10)))
+        self.assertTrue(intervals.overlaps(date(2030, 1, 11), date(2030, 1, 11)))
+        self.assertFalse(intervals.overlaps(date(2030, 1, 13), date(2030, 1, 20)))
+        self.assertFalse(intervals.overlaps(date(2030, 1, 1), date(2030, 1, 9)))
+
+    def test_long_interval_hidden_behind_later_starts(self):
+        intervals = CarIntervals()
+        intervals.add(1, date(2030, 1, 1), date(2030, 1, 31))
+        intervals.add(2, date(2030, 1, 5), date(2030, 1, 6))
+        intervals.add(3, date(2030, 1, 10), date(2030, 1, 11))
+
+        self.assertTrue(intervals.overlaps(date(2030, 1, 20), date(2030, 1, 21)))
+        self.assertTrue(intervals.remove(1))
+        self.assertFalse(intervals.overlaps(date(2030, 1, 20), date(2030, 1, 21)))
+        self.assertTrue(intervals.overlaps(date(2030, 1, 6), date(2030, 1, 7)))
+        self.assertFalse(intervals.remove(1))
+        self.assertEqual(len(intervals), 2)
+
+
+class AvailabilityIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('renter', password='secret')
+        self.cars = [make_car(license_plate=f'AV-{i}') for i in range(3)]
+        availability_index.invalidate()
+        self.addCleanup(availability_index.invalidate)
+
+    def book(self, car, start_date, end_date, status='P'):
+        return Booking.objects.create(
+            user=self.user, car=car, start_date=start_date, end_date=end_date,
+            total_cost=Decimal('100.00'), status=status,
+        )
+
+    def test_index_matches_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.cars[0], date(2030, 1, 1), date(2030, 1, 5))
+            self.book(self.cars[1], date(2030, 1, 4), date(2030, 1, 9), status='C')
+            self.book(self.cars[2], date(2030, 1, 3), date(2030, 1, 6), status='CA')
+            moved = self.book(self.cars[2], date(2030, 2, 1), date(2030, 2, 2))
+        availability_index.ensure_loaded()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.start_date, moved.end_date = date(2030, 1, 6), date(2030, 1, 7)
+            moved.save()
+            self.book(self.cars[0], date(2030, 1, 20), date(2030, 1, 21)).delete()
+
+        for first_day in (date(2030, 1, 1), date(2030, 1, 6), date(2030, 1, 20), date(2030, 2, 1)):
+            self.assertEqual(availability_index.verify(first_day, first_day), (set(), set()))
+        self.assertEqual(
+            availability_index.unavailable_car_ids(date(2030, 1, 5), date(2030, 1, 6)),
+            {car.pk for car in self.cars},
+        )
+
+    def test_bookings_from_other_processes_are_picked_up(self):
+        start_date, end_date = date(2030, 3, 1), date(2030, 3, 3)
+        self.assertEqual(availability_index.unavailable_car_ids(start_date, end_date), set())
+
+        # Another worker's booking: no signal in this process, only the shared generation moves
+        Booking.objects.bulk_create([Booking(
+            user=self.user, car=self.cars[0], start_date=start_date, end_date=end_date,
+            total_cost=Decimal('100.00'), status='P',
+        )])
+        bump_generation(BOOKING_GENERATION_KEY)
+
+        self.assertEqual(availability_index.unavailable_car_ids(start_date, end_date), {self.cars[0].pk})
+
+    def test_own_writes_do_not_force_a_rebuild(self):
+        availability_index.ensure_loaded()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.cars[1].pk, date(2030, 4, 1), date(2030, 4, 2))
+
+        self.assertFalse(availability_index.is_stale())
+        self.assertEqual(
+            availability_index.unavailable_car_ids(date(2030, 4, 2), date(2030, 4, 2)), {self.cars[1].pk}
+        )
+
+
+class CarCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('renter', password='secret')
+        self.car = make_car()
+
+    def counters(self):
+        return Car.objects.filter(pk=self.car.pk).values(
+            'review_count', 'rating_sum', *BOOKING_STATUS_COUNTERS.values()
+        ).get()
+
+    def assertCountersRecomputed(self):
+        counters = self.counters()
+        call_command('recompute_car_counters', stdout=StringIO())
+        self.assertEqual(counters, self.counters())
+
+    def test_counters_follow_booking_and_review_writes(self):
+        booking = create_booking(self.user, self.car.pk, date(2030, 1, 1), date(2030, 1, 3))
+        review = Review.objects.create(user=self.user, car=self.car, rating=4, comment='Fine')
+        self.assertCountersRecomputed()
+
+        booking.status = 'C'
+        booking.save()
+        review.rating = 2
+        review.save()
+        self.assertCountersRecomputed()
+        self.assertEqual(self.counters()['confirmed_bookings'], 1)
+
+        booking.delete()
+        review.delete()
+        self.assertCountersRecomputed()
+        self.assertEqual(self.counters()['review_count'], 0)
+
+    def test_saving_stale_car_keeps_counters(self):
+        car = Car.objects.get(pk=self.car.pk)
+        Review.objects.create(user=self.user, car=self.car, rating=5, comment='Great')
+        car.daily_rate = Decimal('45.00')
+        car.save()
+
+        self.assertEqual(self.counters()['review_count'], 1)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).daily_rate, Decimal('45.00'))
+
+
+class CarListConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.car = make_car(category=CarCategory.objects.create(name='Sedan', description=''))
+
+    def test_booking_changes_etag_of_date_filtered_list(self):
+        url = '/api/cars/?start_date=2030-01-10&end_date=2030-01-12'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.car.pk, date(2030, 1, 11), date(2030, 1, 14))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bookings_outside_range_keep_etag(self):
+        url = '/api/cars/?start_date=2030-01-10&end_date=2030-01-12'
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.car.pk, date(2030, 2, 1), date(2030, 2, 3))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ConditionalGetDeleteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.feature = CarFeature.objects.create(name='GPS')
+        self.car = make_car()
+        self.car.features.add(self.feature)
+        self.other = make_car(license_plate='OTHER-1')
+        # Push every timestamp back, so a change in this second is visible to If-Modified-Since
+        past = timezone.now() - timedelta(hours=1)
+        Car.objects.update(updated_at=past)
+        CarFeature.objects.update(updated_at=past)
+
+    def test_list_is_not_stale_after_a_delete(self):
+        response = self.client.get('/api/cars/')
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        self.other.delete()
+        since = http_date(timezone.now().timestamp())
+        self.assertEqual(self.client.get('/api/cars/', HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleting_a_feature_moves_car_last_modified(self):
+        url = f'/api/cars/{self.car.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.feature.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['features'], [])
+
+
+class BookingBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        self.car = make_car()
+
+    def cancelled_booking(self, start_date, end_date):
+        return Booking.objects.create(
+            user=self.staff, car=self.car, start_date=start_date, end_date=end_date,
+            total_cost=Decimal('100.00'), status='CA',
+        )
+
+    def test_reactivations_in_one_batch_do_not_overlap(self):
+        first = self.cancelled_booking(date(2030, 3, 1), date(2030, 3, 5))
+        second = self.cancelled_booking(date(2030, 3, 4), date(2030, 3, 8))
+        response = self.client.post('/api/bookings/batch/', {'operations': [
+            {'op': 'status', 'id': first.pk, 'status': 'C'},
+            {'op': 'status', 'id': second.pk, 'status': 'C'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['ok'] for item in response.data['results']], [True, False])
+        self.assertEqual(Booking.objects.filter(car=self.car, status='C').count(), 1)
+
+    def test_reactivation_conflicts_with_batch_create(self):
+        cancelled = self.cancelled_booking(date(2030, 3, 1), date(2030, 3, 5))
+        response = self.client.post('/api/bookings/batch/', {'operations': [
+            {'op': 'create', 'car_id': self.car.pk, 'start_date': '2030-03-03', 'end_date': '2030-03-04'},
+            {'op': 'status', 'id': cancelled.pk, 'status': 'P'},
+        ]}, format='json')
+
+        self.assertEqual([item['ok'] for item in response.data['results']], [True, False])
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'CA')
+
+
+class PricingTests(TestCase):
+    # 2030-01-04 is a Friday
+    friday = date(2030, 1, 4)
+
+    def setUp(self):
+        self.car = make_car(daily_rate=Decimal('10.00'), weekend_rate=Decimal('20.00'))
+
+    def test_range_over_a_weekend(self):
+        self.assertEqual(booking_total(self.car, self.friday, self.friday + timedelta(days=3)), Decimal('60.00'))
+
+    def test_weekend_only(self):
+        saturday = self.friday + timedelta(days=1)
+        self.assertEqual(booking_total(self.car, saturday, saturday + timedelta(days=1)), Decimal('40.00'))
+
+    def test_single_day(self):
+        self.assertEqual(booking_total(self.car, self.friday, self.friday), Decimal('10.00'))
+        sunday = self.friday + timedelta(days=2)
+        self.assertEqual(booking_total(self.car, sunday, sunday), Decimal('20.00'))
+
+    def test_missing_weekend_rate_uses_daily_rate(self):
+        self.car.weekend_rate = None
+        self.assertEqual(booking_total(self.car, self.friday, self.friday + timedelta(days=3)), Decimal('40.00'))
+
+    def test_per_car_date_ranges(self):
+        totals = quote_totals(
+            [Decimal('10.00'), Decimal('12.50')],
+            [Decimal('20.00'), None],
+            [self.friday, self.friday + timedelta(days=1)],
+            [self.friday + timedelta(days=3), self.friday + timedelta(days=1)],
+        )
+        self.assertEqual(totals.tolist(), [6000, 1250])
+
+    def test_quote(self):
+        make_car(daily_rate=Decimal('15.00'), license_plate='PLAIN-1')
+        response = APIClient().get('/api/cars/quote/?start_date=2030-01-04&end_date=2030-01-07')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['weekday_days'], response.data['weekend_days']), (2, 2))
+        self.assertEqual([quote['total_cost'] for quote in response.data['quotes']], ['60.00', '60.00'])
+
+    def test_quote_without_matching_cars(self):
+        response = APIClient().get('/api/cars/quote/?start_date=2030-01-04&end_date=2030-01-07&search=nothing-matches')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quotes'], [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # 30 cars, three pages, with many ties on both keys
+        for number in range(30):
+            make_car(daily_rate=Decimal(40 + number % 3 * 5), year=2015 + number % 4, license_plate=f'KEY-{number}')
+
+    def walk(self, url, link):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [car['id'] for car in response.data['results']]
+            ids = ids + page if link == 'next' else page + ids
+            url = response.data[link]
+            pages += 1
+        return ids, pages
+
+    def assert_walks(self, ordering, expected):
+        query = '/api/cars/?pagination=cursor' + (f'&ordering={ordering}' if ordering else '')
+        forward, pages = self.walk(query, 'next')
+        self.assertEqual(forward, expected)
+        self.assertEqual(pages, 3)
+
+        # Back from the last page to the first
+        response = self.client.get(query)
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+        last_page = [car['id'] for car in response.data['results']]
+        backward, pages = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(backward + last_page, expected)
+        self.assertEqual(pages, 2)
+
+    def test_default_ordering(self):
+        self.assert_walks(None, sorted(Car.objects.values_list('id', flat=True)))
+
+    def test_ascending_with_ties(self):
+        cars = Car.objects.values_list('daily_rate', 'id')
+        self.assert_walks('daily_rate', [car_id for _, car_id in sorted(cars)])
+
+    def test_descending_with_ties(self):
+        cars = Car.objects.values_list('year', 'id')
+        self.assert_walks('-year', [car_id for _, car_id in sorted(cars, reverse=True)])
+
+    def test_invalid_cursor(self):
+        bad_id = base64.urlsafe_b64encode(json.dumps({'id': 'x', 'reverse': False}).encode()).decode()
+        for cursor in ('not-a-cursor', bad_id):
+            response = self.client.get(f'/api/cars/?pagination=cursor&ordering=year&cursor={cursor}')
+            self.assertEqual(response.status_code, 404)
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints run the same number of queries however many rows they render"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.client.force_authenticate(self.user)
+        self.category = CarCategory.objects.create(name='Sedan', description='')
+        self.features = [CarFeature.objects.create(name=name) for name in ('GPS', 'Bluetooth')]
+        self.cars = 0
+        self.add_cars(2)
+
+    def add_cars(self, count):
+        for _ in range(count):
+            self.cars += 1
+            car = make_car(category=self.category, license_plate=f'COUNT-{self.cars}')
+            car.features.set(self.features)
+            CarImage.objects.create(car=car, image=f'cars/{self.cars}.jpg', is_primary=True)
+            CarImage.objects.create(car=car, image=f'cars/{self.cars}-side.jpg')
+            day = date(2030, 1, 1) + timedelta(days=self.cars)
+            Booking.objects.create(user=self.user, car=car, start_date=day, end_date=day, total_cost=Decimal('40.00'))
+            Review.objects.create(user=self.user, car=car, rating=4, comment='Fine')
+
+    def count_queries(self, path):
+        # Warm up first, so one-off work such as loading the availability index is not counted
+        self.client.get(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_counts_do_not_grow_with_the_page(self):
+        paths = [
+            '/api/cars/',
+            '/api/cars/?expand=category,features,images',
+            '/api/cars/available/?start_date=2031-01-01&end_date=2031-01-02',
+            '/api/bookings/',
+            '/api/reviews/',
+            '/api/bookings/dashboard/',
+        ]
+        small = {path: self.count_queries(path) for path in paths}
+        self.add_cars(8)
+        self.assertEqual({path: self.count_queries(path) for path in paths}, small)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.car = make_car(category=CarCategory.objects.create(name='Sedan', description=''))
+        self.car.features.add(CarFeature.objects.create(name='GPS'))
+        CarImage.objects.create(car=self.car, image='cars/front.jpg', is_primary=True)
+        Booking.objects.create(
+            user=self.user, car=self.car, start_date=date(2030, 1, 1), end_date=date(2030, 1, 2),
+            total_cost=Decimal('80.00'),
+        )
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data, ' '.join(query['sql'] for query in queries)
+
+    def test_list_is_compact_and_detail_is_full(self):
+        data, sql = self.get('/api/cars/')
+        self.assertIn('"cars_carimage"."image"', sql)
+        self.assertNotIn('"cars_carfeature"."name"', sql)
+        self.assertEqual(
+            set(data['results'][0]),
+            {'id', 'make', 'model', 'year', 'daily_rate', 'primary_image', 'average_rating', 'review_count'},
+        )
+        data, _ = self.get(f'/api/cars/{self.car.pk}/')
+        self.assertTrue({'description', 'category', 'features', 'images'} <= set(data))
+
+    def test_fields_skip_unrequested_relations(self):
+        data, sql = self.get('/api/cars/?fields=id,make')
+        self.assertEqual(set(data['results'][0]), {'id', 'make'})
+        # The conditional GET state reads the related tables too, so look for the joins and prefetches only
+        self.assertNotIn('"cars_carimage"."image"', sql)
+        self.assertNotIn('"cars_carfeature"."name"', sql)
+        self.assertNotIn('"cars_carcategory"."name"', sql)
+
+    def test_expand_adds_relations_to_the_list(self):
+        data, sql = self.get('/api/cars/?expand=features')
+        self.assertEqual([feature['name'] for feature in data['results'][0]['features']], ['GPS'])
+        self.assertIn('"cars_carfeature"."name"', sql)
+
+    def test_dotted_fields_reach_nested_serializers(self):
+        self.client.force_authenticate(self.user)
+        data, sql = self.get('/api/bookings/?fields=id,car.make,car.model')
+        self.assertEqual(data['results'][0], {'id': Booking.objects.get().pk, 'car': {'make': 'Toyota', 'model': 'Corolla'}})
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('cars_carcategory', sql)
+        self.assertNotIn('cars_carimage', sql)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.corolla = make_car(category=CarCategory.objects.create(name='Hatchback', description=''))
+        self.golf = make_car(make='Volkswagen', model='Golf', description='The Corolla of Germany', license_plate='GOLF-1')
+        self.civic = make_car(make='Honda', model='Civic', license_plate='CIVIC-1')
+
+    def search(self, text):
+        response = self.client.get('/api/cars/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [car['id'] for car in response.data['results']]
+
+    def test_search_matches_make_model_and_category(self):
+        self.assertEqual(self.search('honda'), [self.civic.pk])
+        self.assertEqual(self.search('hatchback'), [self.corolla.pk])
+        self.assertEqual(self.search('nothing'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Full-text search needs PostgreSQL')
+    def test_ranked_prefix_search(self):
+        # A make/model match outranks one in the description
+        self.assertEqual(self.search('coroll'), [self.corolla.pk, self.golf.pk])
+        self.assertEqual(self.search('volks golf'), [self.golf.pk])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Full-text search needs PostgreSQL')
+    def test_stopwords_only_is_no_search(self):
+        self.assertEqual(sorted(self.search('the')), sorted([self.corolla.pk, self.golf.pk, self.civic.pk]))
+        self.assertEqual(self.search('the civic'), [self.civic.pk])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', password='secret', is_staff=True))
+        self.user = User.objects.create_user('renter', password='secret')
+        self.car = make_car(license_plate='EXP-1')
+        self.january = Booking.objects.create(
+            user=self.user, car=self.car, start_date=date(2030, 1, 1), end_date=date(2030, 1, 2),
+            total_cost=Decimal('80.00'), status='C',
+        )
+        self.march = Booking.objects.create(
+            user=self.user, car=self.car, start_date=date(2030, 3, 1), end_date=date(2030, 3, 1),
+            total_cost=Decimal('40.00'),
+        )
+
+    def download(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_bookings_csv(self):
+        rows = list(csv.DictReader(StringIO(self.download('/api/exports/bookings.csv'))))
+        self.assertEqual([row['id'] for row in rows], [str(self.january.pk), str(self.march.pk)])
+        self.assertEqual(
+            {key: rows[0][key] for key in ('username', 'car_make', 'start_date', 'total_cost', 'status')},
+            {'username': 'renter', 'car_make': 'Toyota', 'start_date': '2030-01-01', 'total_cost': '80.00', 'status': 'C'},
+        )
+
+    def test_filtered_ndjson(self):
+        lines = self.download('/api/exports/bookings.ndjson?start_date=2030-01-01&end_date=2030-01-31').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.january.pk])
+        lines = self.download('/api/exports/bookings.ndjson?status=P').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.march.pk])
+
+        fleet = [json.loads(line) for line in self.download('/api/exports/fleet.ndjson').splitlines()]
+        self.assertEqual([(car['license_plate'], car['pending_bookings']) for car in fleet], [('EXP-1', 1)])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/api/exports/bookings.xml').status_code, 404)
+        self.assertEqual(self.client.get('/api/exports/reviews.csv?status=P').status_code, 400)
+        self.assertEqual(self.client.get('/api/exports/bookings.csv?status=XX').status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/exports/bookings.csv').status_code, 403)
+
+    def test_command_matches_the_endpoint(self):
+        out = StringIO()
+        call_command('export_data', 'bookings', '--format', 'ndjson', stdout=out)
+        self.assertEqual(out.getvalue(), self.download('/api/exports/bookings.ndjson'))
+
+
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        make_car()
+
+    def server_timing(self, response):
+        match = re.fullmatch(
+            r'db;dur=[\d.]+;desc="(\d+) queries", serialize;dur=[\d.]+, total;dur=[\d.]+',
+            response['Server-Timing'],
+        )
+        self.assertIsNotNone(match, response['Server-Timing'])
+        return int(match.group(1))
+
+    def metric(self, name, route):
+        body = self.client.get('/metrics').content.decode()
+        match = re.search(rf'^{name}{{route="{route}"}} (\S+)$', body, re.MULTILINE)
+        return float(match.group(1)) if match else 0
+
+    def test_server_timing_counts_the_request_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cars/')
+        self.assertEqual(self.server_timing(response), len(queries))
+
+    async def test_server_timing_counts_async_orm_queries(self):
+        response = await self.async_client.get('/api/async/cars/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.server_timing(response), 0)
+
+    def test_requests_are_recorded_by_route(self):
+        before = self.metric('car_hire_db_queries_count', 'car-list')
+        self.client.get('/api/cars/')
+        self.client.get('/api/cars/')
+        self.assertEqual(self.metric('car_hire_db_queries_count', 'car-list'), before + 2)
+
+    def test_metrics_are_limited_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.8').status_code, 403)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test.', ('route',), (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(('home',), value)
+        self.assertEqual(histogram.render()[2:], [
+            'test_seconds_bucket{route="home",le="0.1"} 2',
+            'test_seconds_bucket{route="home",le="1.0"} 3',
+            'test_seconds_bucket{route="home",le="+Inf"} 4',
+            'test_seconds_sum{route="home"} 3.65',
+            'test_seconds_count{route="home"} 4',
+        ])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        category = CarCategory.objects.create(name='Sedan', description='')
+        feature = CarFeature.objects.create(name='GPS')
+        for number in range(14):
+            car = make_car(
+                category=category, daily_rate=Decimal(30 + number % 4 * 5), license_plate=f'ASYNC-{number}',
+            )
+            car.features.add(feature)
+        self.car = car
+        Booking.objects.create(
+            user=User.objects.create_user('renter', password='secret'), car=car,
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 3), total_cost=Decimal('90.00'), status='C',
+        )
+
+    async def test_async_views_match_the_sync_views(self):
+        car_id = self.car.pk
+        category_id = await CarCategory.objects.values_list('pk', flat=True).aget()
+        feature_id = await CarFeature.objects.values_list('pk', flat=True).aget()
+        paths = [
+            'cars/',
+            'cars/?page=2',
+            'cars/?ordering=-daily_rate',
+            'cars/?pagination=cursor&ordering=daily_rate',
+            'cars/?fields=id,make&expand=features',
+            'cars/?search=corolla',
+            'cars/available/?start_date=2030-01-02&end_date=2030-01-05',
+            f'cars/{car_id}/',
+            f'cars/{car_id}/statistics/',
+            'cars/999999/',
+            'categories/',
+            f'categories/{category_id}/',
+            'features/',
+            f'features/{feature_id}/',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                sync_response = await sync_to_async(self.client.get)(f'/api/{path}')
+                async_response = await self.async_client.get(f'/api/async/{path}')
+                self.assertEqual(async_response.status_code, sync_response.status_code)
+                self.assertEqual(
+                    async_response.content.decode().replace('/api/async/', '/api/'),
+                    sync_response.content.decode(),
+                )
+
+
+class SimilarCarsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        sedan = CarCategory.objects.create(name='Sedan', description='')
+        sports = CarCategory.objects.create(name='Sports', description='')
+        self.car = make_car(category=sedan, license_plate='BASE-1')
+        self.twin = make_car(category=sedan, daily_rate=Decimal('41.00'), license_plate='TWIN-1')
+        self.diesel = make_car(category=sedan, fuel_type='D', license_plate='DIESEL-1')
+        self.far = make_car(
+            category=sports, transmission='M', seats=2, year=2010, daily_rate=Decimal('150.00'), license_plate='FAR-1',
+        )
+        # Identical to the car but not rentable
+        make_car(category=sedan, is_available=False, license_plate='OFF-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                user=User.objects.create_user('renter', password='secret'), car=self.twin,
+                start_date=date(2030, 1, 1), end_date=date(2030, 1, 3), total_cost=Decimal('123.00'), status='C',
+            )
+        for index in (similarity_index, availability_index):
+            index.invalidate()
+            self.addCleanup(index.invalidate)
+
+    def similar(self, query=''):
+        response = self.client.get(f'/api/cars/{self.car.pk}/similar/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [car['id'] for car in response.data]
+
+    def test_nearest_first(self):
+        self.assertEqual(self.similar(), [self.twin.pk, self.diesel.pk, self.far.pk])
+        self.assertEqual(self.similar('?count=1'), [self.twin.pk])
+
+    def test_date_range_skips_booked_cars(self):
+        self.assertEqual(self.similar('?start_date=2030-01-03&end_date=2030-01-05'), [self.diesel.pk, self.far.pk])
+        self.assertEqual(
+            self.similar('?start_date=2030-01-04&end_date=2030-01-05'), [self.twin.pk, self.diesel.pk, self.far.pk],
+        )
+
+    def test_follows_car_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.similar()
+            self.diesel.fuel_type = 'P'
+            self.diesel.daily_rate = Decimal('40.00')
+            self.diesel.save()
+        self.assertEqual(self.similar(), [self.diesel.pk, self.twin.pk, self.far.pk])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(f'/api/cars/{self.car.pk}/similar/?count=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/cars/999999/similar/').status_code, 404)
+
+
+class ReviewHistogramTests(TestCase):
+    def setUp(self):
+        # Histograms cached by earlier tests may belong to a car with the same id
+        cache.clear()
+        self.client = APIClient()
+        self.car = make_car()
+        self.users = [User.objects.create_user(f'reviewer-{i}', password='secret') for i in range(3)]
+
+    def summary(self):
+        response = self.client.get(f'/api/cars/{self.car.pk}/reviews/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['review_count'], response.data['average_rating'], response.data['rating_histogram']
+
+    def review(self, user, rating):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/reviews/', {'car_id': self.car.pk, 'rating': rating, 'comment': 'Ok'}, format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_histogram_follows_review_writes(self):
+        self.assertEqual(self.summary(), (0, None, {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}))
+
+        self.review(self.users[0], 5)
+        first = self.review(self.users[1], 4)
+        self.review(self.users[2], 4)
+        self.assertEqual(self.summary(), (3, 13 / 3, {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.patch(f'/api/reviews/{first}/', {'rating': 1}, format='json').status_code, 200)
+        self.assertEqual(self.summary(), (3, 10 / 3, {'1': 1, '2': 0, '3': 0, '4': 1, '5': 1}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/reviews/{first}/').status_code, 204)
+        self.assertEqual(self.summary(), (2, 4.5, {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1}))
+
+    def test_histogram_is_cached_between_writes(self):
+        self.review(self.users[0], 3)
+        self.summary()
+        with CaptureQueriesContext(connection) as queries:
+            self.summary()
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in queries))
+
+
+class BookingDashboardTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+        self.cars = [make_car(license_plate=f'DASH-{i}') for i in range(3)]
+        for car in self.cars:
+            CarImage.objects.create(car=car, image=f'cars/{car.pk}.jpg', is_primary=True)
+        self.bookings = {}
+        for name, car, start, end, booking_status in (
+            ('active', 0, -2, 2, 'A'),
+            ('started', 1, 0, 1, 'C'),
+            ('soon', 2, 3, 4, 'P'),
+            ('later', 0, 10, 12, 'C'),
+            ('finished', 1, -10, -8, 'CO'),
+            ('cancelled', 2, -5, -4, 'CA'),
+            ('lapsed', 0, -20, -19, 'P'),
+        ):
+            self.bookings[name] = Booking.objects.create(
+                user=self.user, car=self.cars[car], start_date=self.today + timedelta(days=start),
+                end_date=self.today + timedelta(days=end), total_cost=Decimal('40.00'), status=booking_status,
+            )
+        other = User.objects.create_user('other', password='secret')
+        Booking.objects.create(
+            user=other, car=self.cars[1], start_date=self.today + timedelta(days=30),
+            end_date=self.today + timedelta(days=31), total_cost=Decimal('80.00'),
+        )
+
+    def ids(self, *names):
+        return [self.bookings[name].pk for name in names]
+
+    def test_groups_and_counts_in_five_queries(self):
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/bookings/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['status_counts'], {'P': 2, 'C': 2, 'A': 1, 'CO': 1, 'CA': 1})
+        self.assertEqual([booking['id'] for booking in data['active']], self.ids('active', 'started'))
+        self.assertEqual([booking['id'] for booking in data['upcoming']], self.ids('soon', 'later'))
+        self.assertEqual([booking['id'] for booking in data['past']], self.ids('cancelled', 'finished', 'lapsed'))
+        self.assertEqual(data['active'][0]['car']['thumbnail'], f'http://testserver/media/cars/{self.cars[0].pk}.jpg')
+
+    def test_limit(self):
+        response = self.client.get('/api/bookings/dashboard/?limit=1')
+        self.assertEqual([booking['id'] for booking in response.data['past']], self.ids('cancelled'))
+        self.assertEqual(self.client.get('/api/bookings/dashboard/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/bookings/dashboard/?limit=x').status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+        self.count = 0
+        self.add_rows(3)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.count += 1
+            user = User.objects.create_user(f'customer-{self.count}')
+            category = CarCategory.objects.create(name=f'Class {self.count}', description='')
+            car = make_car(category=category, license_plate=f'ADMIN-{self.count}')
+            day = date(2030, 1, 1) + timedelta(days=self.count)
+            Booking.objects.create(user=user, car=car, start_date=day, end_date=day, total_cost=Decimal('40.00'))
+            Review.objects.create(user=user, car=car, rating=4, comment='Fine')
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as queries, self.assertNoLogs('cars.admin', 'WARNING'):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_the_page(self):
+        paths = ['/admin/cars/car/', '/admin/cars/booking/', '/admin/cars/review/']
+        small = {path: self.count_queries(path) for path in paths}
+        self.add_rows(20)
+        self.assertEqual({path: self.count_queries(path) for path in paths}, small)
+
+    def test_search_by_id_and_exact_fields(self):
+        booking = Booking.objects.order_by('id').last()
+        for term in (booking.pk, booking.user.username, booking.car.license_plate):
+            response = self.client.get('/admin/cars/booking/', {'q': term})
+            self.assertEqual([row.pk for row in response.context['cl'].result_list], [booking.pk])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Row estimates come from the PostgreSQL planner')
+    def test_estimated_count_reads_the_plan(self):
+        self.assertIsInstance(EstimatedCountPaginator.estimated_count(Booking.objects.all()), int)
+
+
+class CacheGenerationTests(TestCase):
+    def setUp(self):
+        # Histograms cached by earlier tests may belong to a car with the same id
+        cache.clear()
+
+    def test_evicted_generation_does_not_revive_old_entries(self):
+        user = User.objects.create_user('renter', password='secret')
+        car = make_car()
+        self.assertEqual(rating_histogram(car.pk)['4'], 0)
+
+        # Written without signals, then the generation key is evicted
+        Review.objects.bulk_create([Review(user=user, car=car, rating=4, comment='Good')])
+        cache.delete(histogram_generation_key(car.pk))
+
+        self.assertEqual(rating_histogram(car.pk)['4'], 1)
+
+
+class CreateBookingTests(TestCase):
+    def test_overlapping_booking_is_refused(self):
+        user = User.objects.create_user('renter', password='secret')
+        car = make_car()
+        create_booking(user, car.pk, date(2030, 5, 1), date(2030, 5, 4))
+
+        with self.assertRaises(BookingConflict):
+            create_booking(user, car.pk, date(2030, 5, 4), date(2030, 5, 6))
+        create_booking(user, car.pk, date(2030, 5, 5), date(2030, 5, 6))
+        self.assertEqual(Booking.objects.filter(car=car).count(), 2)
+
+
+class BookingUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.client.force_authenticate(self.user)
+        self.car = make_car()
+        self.booking = create_booking(self.user, self.car.pk, date(2030, 1, 7), date(2030, 1, 8))
+
+    def patch(self, **data):
+        return self.client.patch(f'/api/bookings/{self.booking.pk}/', data, format='json')
+
+    def test_overlapping_dates_are_refused(self):
+        create_booking(self.user, self.car.pk, date(2030, 1, 10), date(2030, 1, 12))
+        response = self.patch(end_date='2030-01-11')
+
+        self.assertEqual(response.status_code, 409)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_date, date(2030, 1, 8))
+
+    def test_new_dates_are_repriced(self):
+        response = self.patch(end_date='2030-01-10')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_cost'], '160.00')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.total_cost, Decimal('160.00'))
+
+    def test_car_cannot_be_changed(self):
+        other = make_car(license_plate='OTHER-1')
+        response = self.patch(car_id=other.pk)
+
+        self.assertEqual(response.status_code, 400)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.car_id, self.car.pk)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.category = CarCategory.objects.create(name='Sedan', description='')
+        self.car = make_car(category=self.category)
+
+    def car_days(self, car=None):
+        rows = CarDailyRollup.objects.filter(car=car or self.car).order_by('day')
+        return [(row.day, row.booked, row.revenue) for row in rows]
+
+    def category_days(self):
+        rows = CategoryDailyRollup.objects.filter(category=self.category).order_by('day')
+        return [(row.day, row.booked, row.revenue) for row in rows]
+
+    def confirmed_booking(self, start_date, end_date, car=None):
+        booking = create_booking(self.user, (car or self.car).pk, start_date, end_date)
+        booking.status = 'C'
+        booking.save()
+        return booking
+
+    def test_pending_bookings_are_not_rolled_up(self):
+        create_booking(self.user, self.car.pk, date(2030, 1, 10), date(2030, 1, 11))
+        self.assertEqual(self.car_days(), [])
+
+    def test_confirm_then_cancel(self):
+        booking = self.confirmed_booking(date(2030, 1, 10), date(2030, 1, 11))
+        expected = [(date(2030, 1, 10), 1, Decimal('40.00')), (date(2030, 1, 11), 1, Decimal('40.00'))]
+        self.assertEqual(self.car_days(), expected)
+        self.assertEqual(self.category_days(), expected)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(f'/api/bookings/{booking.pk}/cancel/').status_code, 200)
+        self.assertEqual(self.car_days(), [])
+        self.assertEqual(self.category_days(), [])
+
+    def test_delete_removes_days(self):
+        booking = self.confirmed_booking(date(2030, 1, 10), date(2030, 1, 11))
+        booking.delete()
+        self.assertEqual(self.car_days(), [])
+        self.assertEqual(self.category_days(), [])
+
+    def test_moving_across_a_month_boundary(self):
+        booking = self.confirmed_booking(date(2030, 1, 10), date(2030, 1, 12))
+        change_booking_dates(booking, date(2030, 1, 30), date(2030, 2, 2))
+
+        days = [date(2030, 1, 30), date(2030, 1, 31), date(2030, 2, 1), date(2030, 2, 2)]
+        self.assertEqual(self.car_days(), [(day, 1, Decimal('40.00')) for day in days])
+        self.assertEqual(self.category_days(), [(day, 1, Decimal('40.00')) for day in days])
+
+    def test_backfill_matches_incremental_rows(self):
+        other = make_car(category=self.category, license_plate='OTHER-1')
+        uncategorized = make_car(license_plate='OTHER-2')
+        # 100.00 over three days leaves a cent over
+        Booking.objects.create(
+            user=self.user, car=self.car, start_date=date(2030, 1, 30), end_date=date(2030, 2, 1),
+            total_cost=Decimal('100.00'), status='C',
+        )
+        self.confirmed_booking(date(2030, 1, 31), date(2030, 2, 3), car=other)
+        self.confirmed_booking(date(2030, 1, 1), date(2030, 1, 2), car=uncategorized)
+        create_booking(self.user, self.car.pk, date(2030, 3, 1), date(2030, 3, 2))
+        cancelled = self.confirmed_booking(date(2030, 3, 5), date(2030, 3, 6))
+        cancelled.status = 'CA'
+        cancelled.save()
+
+        def snapshot():
+            return (
+                sorted(CarDailyRollup.objects.values_list('car_id', 'category_id', 'day', 'booked', 'revenue')),
+                sorted(CategoryDailyRollup.objects.values_list('category_id', 'day', 'booked', 'revenue')),
+            )
+
+        incremental = snapshot()
+        self.assertIn((self.car.pk, self.category.pk, date(2030, 1, 30), 1, Decimal('33.34')), incremental[0])
+        CarDailyRollup.objects.all().delete()
+        CategoryDailyRollup.objects.all().delete()
+        call_command('backfill_rollups', batch_size=1, stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_analytics_intervals(self):
+        self.confirmed_booking(date(2030, 1, 30), date(2030, 2, 2))
+        make_car(category=self.category, license_plate='IDLE-1')
+        self.client.force_authenticate(User.objects.create_user('staff', password='secret', is_staff=True))
+        query = 'start_date=2030-01-01&end_date=2030-02-28'
+
+        response = self.client.get(f'/api/analytics/cars/{self.car.pk}/?{query}&interval=total')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['periods'], [{
+            'period': date(2030, 1, 1), 'booked_days': 4, 'utilization': round(4 / 59, 4), 'revenue': '160.00',
+        }])
+
+        response = self.client.get(f'/api/analytics/cars/{self.car.pk}/?{query}&interval=month')
+        self.assertEqual(
+            [(row['period'], row['booked_days'], row['utilization'], row['revenue']) for row in response.data['periods']],
+            [
+                (date(2030, 1, 1), 2, round(2 / 31, 4), '80.00'),
+                (date(2030, 2, 1), 2, round(2 / 28, 4), '80.00'),
+            ],
+        )
+
+        response = self.client.get(f'/api/analytics/cars/{self.car.pk}/?{query}&interval=day')
+        self.assertEqual(
+            [(row['period'], row['utilization']) for row in response.data['periods']],
+            [(date(2030, 1, 30), 1.0), (date(2030, 1, 31), 1.0), (date(2030, 2, 1), 1.0), (date(2030, 2, 2), 1.0)],
+        )
+
+        # Two cars in the category halve its utilization
+        response = self.client.get(f'/api/analytics/categories/?{query}&interval=month&category={self.category.pk}')
+        self.assertEqual(
+            [(row['category_id'], row['period'], row['utilization']) for row in response.data['periods']],
+            [(self.category.pk, date(2030, 1, 1), round(2 / 62, 4)), (self.category.pk, date(2030, 2, 1), round(2 / 56, 4))],
+        )
+
+    def test_analytics_are_staff_only(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/analytics/cars/{self.car.pk}/?start_date=2030-01-01&end_date=2030-01-31')
+        self.assertEqual(response.status_code, 403)
+
+
+class ImageDerivativeTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.car = make_car()
+
+    def add_image(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'navy').save(buffer, 'JPEG')
+        name = default_storage.save('cars/photo.jpg', ContentFile(buffer.getvalue()))
+        # bulk_create skips the post_save signal, so only the command renders derivatives
+        return CarImage.objects.bulk_create([CarImage(car=self.car, image=name)])[0]
+
+    def test_backfill_renders_every_size_without_upscaling(self):
+        wide = self.add_image((2000, 1000))
+        small = self.add_image((500, 250))
+        call_command('backfill_image_derivatives', stdout=StringIO())
+
+        sizes = {}
+        for image in (wide, small):
+            image.refresh_from_db()
+            self.assertEqual(set(image.derivatives), {'thumbnail', 'medium', 'large'})
+            for name, formats in image.derivatives.items():
+                self.assertEqual(set(formats), {'jpeg', 'webp'})
+                with default_storage.open(formats['webp']) as stored, Image.open(stored) as rendered:
+                    self.assertEqual(rendered.format, 'WEBP')
+                with default_storage.open(formats['jpeg']) as stored, Image.open(stored) as rendered:
+                    sizes[image.pk, name] = rendered.size
+        self.assertEqual(sizes, {
+            (wide.pk, 'thumbnail'): (320, 160),
+            (wide.pk, 'medium'): (800, 400),
+            (wide.pk, 'large'): (1600, 800),
+            (small.pk, 'thumbnail'): (320, 160),
+            (small.pk, 'medium'): (500, 250),
+            (small.pk, 'large'): (500, 250),
+        })
+
+    def test_serializers_expose_derivative_urls(self):
+        image = self.add_image((1000, 500))
+        client = APIClient()
+        self.assertEqual(client.get(f'/api/cars/{self.car.pk}/').data['images'][0]['derivatives'], {})
+
+        call_command('backfill_image_derivatives', stdout=StringIO())
+        image.refresh_from_db()
+        derivatives = client.get(f'/api/cars/{self.car.pk}/').data['images'][0]['derivatives']
+        self.assertEqual(
+            derivatives['thumbnail']['webp'],
+            'http://testserver' + default_storage.url(image.derivatives['thumbnail']['webp']),
+        )
+        primary_image = client.get('/api/cars/').data['results'][0]['primary_image']
+        self.assertEqual(primary_image['derivatives'], derivatives)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row locks and the exclusion constraint need PostgreSQL')
+class ConcurrentBookingTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('renter', password='secret')
+        self.car = make_car()
+
+    def test_concurrent_creates_book_a_car_once(self):
+        workers = 8
+        barrier = threading.Barrier(workers)
+        outcomes = []
+
+        def book():
+            try:
+                barrier.wait()
+                create_booking(self.user, self.car.pk, date(2030, 6, 1), date(2030, 6, 5))
+                outcomes.append('booked')
+            except BookingConflict:
+                outcomes.append('conflict')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['booked'] + ['conflict'] * (workers - 1))
+        self.assertEqual(Booking.objects.filter(car=self.car).count(), 1)
+
+    def test_exclusion_constraint_rejects_overlap(self):
+        values = {'user': self.user, 'car': self.car, 'total_cost': Decimal('100.00'), 'status': 'C'}
+        Booking.objects.create(start_date=date(2030, 7, 1), end_date=date(2030, 7, 5), **values)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.create(start_date=date(2030, 7, 5), end_date=date(2030, 7, 8), **values)
+        # Cancelled bookings are outside the constraint
+        Booking.objects.create(start_date=date(2030, 7, 3), end_date=date(2030, 7, 4), **{**values, 'status': 'CA'})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against a second SQLite database standing in for a replica"""
+    # 'replica' only exists once setUpClass has registered it
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings['replica'] = connections.configure_settings({
+            'default': connections.settings['default'],
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'{cls.replica_dir}/replica.sqlite3'},
+        })['replica']
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('renter', password='secret')
+        self.client.force_login(self.user)
+        self.primary_car = make_car(license_plate='PRIMARY-1')
+        # Only on the replica, with an id the primary does not have
+        self.replica_car = Car.objects.using('replica').create(
+            id=self.primary_car.pk + 100, make='Kia', model='Rio', year=2021, transmission='M',
+            fuel_type='P', seats=5, daily_rate=Decimal('30.00'), description='Replica only',
+        )
+        self.booking = create_booking(self.user, self.primary_car.pk, date(2030, 1, 1), date(2030, 1, 2))
+
+    def tables_read(self, alias, *paths):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            for path in paths:
+                self.client.get(path)
+        return ' '.join(query['sql'] for query in queries)
+
+    def test_gets_read_cars_from_the_replica(self):
+        self.assertEqual(self.client.get(f'/api/cars/{self.replica_car.pk}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/cars/{self.primary_car.pk}/').status_code, 404)
+
+    def test_bookings_users_and_sessions_stay_on_the_primary(self):
+        response = self.client.get('/api/bookings/')
+        self.assertEqual([booking['id'] for booking in response.data['results']], [self.booking.pk])
+
+        replica_sql = self.tables_read('replica', '/api/bookings/', f'/api/cars/{self.replica_car.pk}/')
+        for table in ('cars_booking', 'auth_user', 'django_session'):
+            self.assertNotIn(table, replica_sql)
+        self.assertIn('cars_car', replica_sql)
+
+    def test_writes_keep_the_client_on_the_primary(self):
+        response = self.client.post('/api/bookings/', {
+            'car_id': self.primary_car.pk, 'start_date': '2030-02-01', 'end_date': '2030-02-02',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        self.assertEqual(self.client.get(f'/api/cars/{self.primary_car.pk}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/cars/{self.replica_car.pk}/').status_code, 404)
+
+    async def test_async_views_route_the_same_way(self):
+        self.assertEqual((await self.async_client.get(f'/api/async/cars/{self.replica_car.pk}/')).status_code, 200)
+        self.assertEqual((await self.async_client.get(f'/api/async/cars/{self.primary_car.pk}/')).status_code, 404)
+
+        self.async_client.cookies[PRIMARY_COOKIE] = '1'
+        self.assertEqual((await self.async_client.get(f'/api/async/cars/{self.primary_car.pk}/')).status_code, 200)
+        self.assertEqual((await self.async_client.get(f'/api/async/cars/{self.replica_car.pk}/')).status_code, 404)
@@ -1,8 +1,9 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
+from .async_views import AsyncCarView, AsyncCategoryView, AsyncFeatureView
 from .views import (
     CarViewSet, CarCategoryViewSet, CarFeatureViewSet,
-    CarImageViewSet, BookingViewSet, ReviewViewSet
+    CarImageViewSet, CarReviewViewSet, BookingViewSet, ReviewViewSet, ExportView, CarRollupView, CategoryRollupView
 )
 
 router = DefaultRouter()
@@ -10,9 +11,26 @@ router.register(r'categories', CarCategoryViewSet)
 router.register(r'features', CarFeatureViewSet)
 router.register(r'cars', CarViewSet)
 router.register(r'cars/(?P<car_pk>\d+)/images', CarImageViewSet)
+router.register(r'cars/(?P<car_pk>\d+)/reviews', CarReviewViewSet, basename='car-review')
 router.register(r'bookings', BookingViewSet, basename='booking')
 router.register(r'reviews', ReviewViewSet, basename='review')
 
+# Async (ASGI) versions of the catalogue reads, same responses as the routes above
+async_urlpatterns = [
+    path('cars/', AsyncCarView.as_view(), name='async-car-list'),
+    path('cars/available/', AsyncCarView.as_view(), {'action': 'available'}, name='async-car-available'),
+    path('cars/<int:pk>/', AsyncCarView.as_view(), name='async-car-detail'),
+    path('cars/<int:pk>/statistics/', AsyncCarView.as_view(), {'action': 'statistics'}, name='async-car-statistics'),
+    path('categories/', AsyncCategoryView.as_view(), name='async-category-list'),
+    path('categories/<int:pk>/', AsyncCategoryView.as_view(), name='async-category-detail'),
+    path('features/', AsyncFeatureView.as_view(), name='async-feature-list'),
+    path('features/<int:pk>/', AsyncFeatureView.as_view(), name='async-feature-detail'),
+]
+
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
+    path('exports/<str:name>.<str:file_format>', ExportView.as_view(), name='export'),
+    path('analytics/cars/<int:pk>/', CarRollupView.as_view(), name='analytics-car'),
+    path('analytics/categories/', CategoryRollupView.as_view(), name='analytics-categories'),
 ]
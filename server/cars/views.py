@@ -1,21 +1,40 @@
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import mixins, viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q, Avg
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from datetime import datetime
-from .models import Car, CarCategory, CarFeature, CarImage, Booking, Review
+from django.conf import settings
+from django.db.models import Count, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .availability import availability_index
+from .bookings import apply_booking_batch, dashboard_groups, status_counts
+from .calendar import car_calendars, parse_calendar_params
+from .conditional import ConditionalGetMixin, table_state
+from .exports import EXPORT_FORMATS, EXPORTS, export_lines
+from .facets import cached_facet_counts
+from .filters import CarAvailabilityFilter, CarFacetFilter, int_list, parse_date_range, split_param
+from .pagination import KeysetPagination
+from .pricing import cents_to_decimal, day_split, quote_totals
+from .reviews import rating_histogram
+from .rollups import ROLLUP_INTERVALS, rollup_report
+from .search import CarSearchFilter
+from .similarity import similarity_index
+from .models import Car, CarCategory, CarDailyRollup, CarFeature, CarImage, Booking, CategoryDailyRollup, Review
 from .serializers import (
-    CarSerializer, CarCategorySerializer, CarFeatureSerializer,
-    CarImageSerializer, BookingSerializer, ReviewSerializer
+    CarSerializer, CarListSerializer, CarCategorySerializer, CarFeatureSerializer,
+    CarImageSerializer, BookingSerializer, BookingOperationSerializer, CarReviewSerializer,
+    DashboardBookingSerializer, ReviewSerializer
 )
 
-class CarCategoryViewSet(viewsets.ModelViewSet):
+class CarCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = CarCategory.objects.all()
     serializer_class = CarCategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class CarFeatureViewSet(viewsets.ModelViewSet):
+class CarFeatureViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = CarFeature.objects.all()
     serializer_class = CarFeatureSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -29,23 +48,154 @@ class CarImageViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(car_id=self.kwargs.get('car_pk'))
 
-class CarViewSet(viewsets.ModelViewSet):
+class CarViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [CarSearchFilter, CarFacetFilter, CarAvailabilityFilter, filters.OrderingFilter]
+    # Used by the fallback search on databases without full-text search
     search_fields = ['make', 'model', 'year', 'transmission', 'fuel_type', 'category__name']
     ordering_fields = ['daily_rate', 'year']
+    cursor_ordering_fields = ['daily_rate', 'year']
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'available', 'similar'):
+            return CarListSerializer
+        return CarSerializer
+
+    def get_queryset(self):
+        if self.action in ('statistics', 'calendar', 'similar'):
+            # Only the car row itself is needed, no joins or aggregation
+            return Car.objects.all()
+        # Only join and prefetch the relations the response will render
+        return self.get_serializer().optimize_queryset(super().get_queryset())
+
+    def get_conditional_state(self):
+        """Cars embed their category, features and images, so all four count.
+
+        A list filtered by start_date/end_date also depends on the bookings
+        overlapping that range.
+        """
+        if self.action == 'retrieve':
+            car = Car.objects.filter(pk=self.kwargs['pk'])
+            return [
+                table_state(car),
+                table_state(CarCategory.objects.filter(car__in=car)),
+                table_state(CarFeature.objects.filter(car__in=car)),
+                table_state(CarImage.objects.filter(car__in=car)),
+            ]
+        state = [table_state(model.objects.all()) for model in (Car, CarCategory, CarFeature, CarImage)]
+        date_range = parse_date_range(self.request)
+        if date_range:
+            # Any status, so cancelling or confirming one of them changes the state too
+            start_date, end_date = date_range
+            state.append(table_state(Booking.objects.filter(start_date__lte=end_date, end_date__gte=start_date)))
+        return state
 
     @action(detail=True, methods=['GET'])
     def statistics(self, request, pk=None):
         """Get statistics for a specific car"""
         car = self.get_object()
-        avg_rating = Review.objects.filter(car=car).aggregate(Avg('rating'))
-        total_bookings = Booking.objects.filter(car=car).count()
         return Response({
-            'average_rating': avg_rating['rating__avg'],
-            'total_bookings': total_bookings
+            'average_rating': car.average_rating,
+            'total_bookings': car.total_bookings
+        })
+
+    @action(detail=True, methods=['GET'])
+    def calendar(self, request, pk=None):
+        """Get a car's booked days between `from` and `to`"""
+        car = self.get_object()
+        first_day, last_day, encoding = parse_calendar_params(request)
+        return Response({
+            'car_id': car.pk,
+            'from': first_day,
+            'to': last_day,
+            'encoding': encoding,
+            'booked': car_calendars([car.pk], first_day, last_day, encoding)[car.pk],
+        })
+
+    @action(detail=False, methods=['GET'], url_path='calendar')
+    def calendars(self, request):
+        """Get the booked days of every car in a category, for one calendar view"""
+        if not request.query_params.get('category'):
+            return Response(
+                {"error": "Please provide a category parameter"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        first_day, last_day, encoding = parse_calendar_params(request)
+        car_ids = list(self.filter_queryset(Car.objects.all()).order_by('id').values_list('id', flat=True))
+        calendars = car_calendars(car_ids, first_day, last_day, encoding)
+        return Response({
+            'from': first_day,
+            'to': last_day,
+            'encoding': encoding,
+            'cars': [{'car_id': car_id, 'booked': calendars[car_id]} for car_id in car_ids],
+        })
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk=None):
+        """Get the cars most like this one, optionally only those free for a date range"""
+        car = self.get_object()
+        max_count = getattr(settings, 'SIMILAR_CARS_MAX', 24)
+        try:
+            count = int(request.query_params.get('count', getattr(settings, 'SIMILAR_CARS_DEFAULT', 6)))
+        except ValueError:
+            count = 0
+        if not 1 <= count <= max_count:
+            return Response(
+                {"error": f"count must be a whole number from 1 to {max_count}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        date_range = parse_date_range(request)
+        unavailable_cars = availability_index.unavailable_car_ids(*date_range) if date_range else ()
+
+        car_ids = similarity_index.similar(car.pk, count, exclude=unavailable_cars) or []
+        cars = self.get_serializer().optimize_queryset(Car.objects.filter(pk__in=car_ids)).in_bulk()
+        serializer = self.get_serializer([cars[car_id] for car_id in car_ids if car_id in cars], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['GET'])
+    def facets(self, request):
+        """Get per-value car counts for every filter, under the current filters"""
+        queryset = Car.objects.all()
+        for backend in (CarSearchFilter, CarAvailabilityFilter):
+            queryset = backend().filter_queryset(request, queryset, self)
+        facet_filters = CarFacetFilter().get_facet_filters(request)
+        return Response(cached_facet_counts(request, queryset, facet_filters))
+
+    @action(detail=False, methods=['GET'])
+    def quote(self, request):
+        """Get the total price of every available car for a date range"""
+        date_range = parse_date_range(request)
+        if date_range is None:
+            return Response(
+                {"error": "Please provide start_date and end_date parameters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        start_date, end_date = date_range
+        if end_date < start_date:
+            return Response(
+                {"error": "end_date cannot be before start_date"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Search, facet filters and availability all apply, in one query
+        cars = list(
+            self.filter_queryset(Car.objects.all())
+            .order_by('id')
+            .values_list('id', 'daily_rate', 'weekend_rate')
+        )
+        totals = quote_totals([car[1] for car in cars], [car[2] for car in cars], start_date, end_date)
+        weekdays, weekend_days = day_split(start_date, end_date)
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'weekday_days': int(weekdays),
+            'weekend_days': int(weekend_days),
+            'quotes': [
+                {'car_id': car[0], 'total_cost': str(cents_to_decimal(cents))}
+                for car, cents in zip(cars, totals)
+            ],
         })
 
     @action(detail=False, methods=['GET'])
@@ -70,23 +220,23 @@ class CarViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get cars that are not booked in the given date range
-        unavailable_cars = Booking.objects.filter(
-            Q(start_date__lte=end_date) & Q(end_date__gte=start_date),
-            status__in=['P', 'C', 'A']  # Pending, Confirmed, or Active bookings
-        ).values_list('car_id', flat=True)
+        # Cars with a Pending, Confirmed or Active booking in the date range
+        unavailable_cars = availability_index.unavailable_car_ids(start_date, end_date)
 
-        available_cars = Car.objects.exclude(id__in=unavailable_cars)
+        available_cars = self.get_queryset().exclude(id__in=unavailable_cars)
         serializer = self.get_serializer(available_cars, many=True)
         return Response(serializer.data)
 
 class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering_fields = ['created_at']
+    cursor_default_ordering = '-created_at'
 
     def get_queryset(self):
         """Users can only see their own bookings"""
-        return Booking.objects.filter(user=self.request.user)
+        queryset = Booking.objects.filter(user=self.request.user)
+        return self.get_serializer().optimize_queryset(queryset)
 
     @action(detail=True, methods=['POST'])
     def cancel(self, request, pk=None):
@@ -94,7 +244,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking = self.get_object()
         if booking.status in ['P', 'C']:  # Can only cancel Pending or Confirmed bookings
             booking.status = 'CA'
-            booking.save()
+            booking.save(update_fields=['status', 'updated_at'])  # signal frees the dates
             serializer = self.get_serializer(booking)
             return Response(serializer.data)
         return Response(
@@ -102,12 +252,172 @@ class BookingViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(detail=False, methods=['GET'])
+    def dashboard(self, request):
+        """Get the user's active, upcoming and recent past bookings with per-status counts"""
+        max_limit = getattr(settings, 'BOOKING_DASHBOARD_MAX_LIMIT', 50)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= max_limit:
+            return Response(
+                {"error": f"limit must be a whole number from 1 to {max_limit}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        bookings = Booking.objects.filter(user=request.user)
+        serializer = DashboardBookingSerializer(many=True, context=self.get_serializer_context())
+        select, prefetch = serializer.child.related_lookups()
+        groups = {
+            name: list(bookings.filter(condition).select_related(*select).order_by(ordering, 'id')[:limit])
+            for name, (condition, ordering) in dashboard_groups(timezone.localdate()).items()
+        }
+        # One round of prefetches (thumbnails) for all groups together
+        prefetch_related_objects([booking for group in groups.values() for booking in group], *prefetch)
+        return Response({
+            'status_counts': status_counts(bookings),
+            **{
+                name: DashboardBookingSerializer(group, many=True, context=self.get_serializer_context()).data
+                for name, group in groups.items()
+            },
+        })
+
+    @action(detail=False, methods=['POST'])
+    def batch(self, request):
+        """Create, cancel or change the status of many bookings at once"""
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {"error": "Please provide a non-empty operations list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_size = getattr(settings, 'BOOKING_BATCH_MAX_SIZE', 500)
+        if len(operations) > max_size:
+            return Response(
+                {"error": f"A batch can hold at most {max_size} operations"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = {}
+        valid = []
+        for index, item in enumerate(operations):
+            serializer = BookingOperationSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'ok': False, 'errors': serializer.errors}
+        results.update(apply_booking_batch(request.user, valid))
+        return Response({'results': [results[index] for index in range(len(operations))]})
+
 class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cursor_ordering_fields = ['created_at']
+    cursor_default_ordering = '-created_at'
 
     def get_queryset(self):
-        return Review.objects.all()
+        return self.get_serializer().optimize_queryset(Review.objects.all())
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+class CarReviewViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """One car's reviews, newest first, with its rating summary"""
+    serializer_class = CarReviewSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    cursor_ordering_fields = ['created_at']
+    cursor_default_ordering = '-created_at'
+
+    def get_queryset(self):
+        queryset = Review.objects.filter(car_id=self.kwargs['car_pk'])
+        return self.get_serializer().optimize_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        car = Car.objects.filter(pk=self.kwargs['car_pk']).values_list('review_count', 'rating_sum').first()
+        if car is None:
+            return Response({"error": "Car not found"}, status=status.HTTP_404_NOT_FOUND)
+        review_count, rating_sum = car
+        response = super().list(request, *args, **kwargs)
+        response.data = {
+            'review_count': review_count,
+            'average_rating': rating_sum / review_count if review_count else None,
+            'rating_histogram': rating_histogram(self.kwargs['car_pk']),
+            **response.data,
+        }
+        return response
+
+class ExportView(APIView):
+    """Stream a full bookings, reviews or fleet dump as CSV or NDJSON (staff only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, name, file_format):
+        if name not in EXPORTS or file_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unknown export. Use one of {', '.join(EXPORTS)} as .csv or .ndjson"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        lines = export_lines(
+            name,
+            file_format,
+            date_range=parse_date_range(request),
+            statuses=split_param(request, 'status'),
+        )
+        response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{file_format}"'
+        return response
+
+
+class RollupView(APIView):
+    """Utilization and revenue read from the daily rollup tables (staff only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_report_params(self, request):
+        date_range = parse_date_range(request)
+        if date_range is None:
+            raise ValidationError({"error": "Please provide start_date and end_date parameters"})
+        if date_range[1] < date_range[0]:
+            raise ValidationError({"error": "end_date cannot be before start_date"})
+        interval = request.query_params.get('interval', 'total')
+        if interval not in ROLLUP_INTERVALS:
+            raise ValidationError({"error": f"interval must be one of: {', '.join(ROLLUP_INTERVALS)}"})
+        return date_range, interval
+
+
+class CarRollupView(RollupView):
+    def get(self, request, pk):
+        (start_date, end_date), interval = self.get_report_params(request)
+        if not Car.objects.filter(pk=pk).exists():
+            return Response({"error": "Car not found"}, status=status.HTTP_404_NOT_FOUND)
+        report = rollup_report(
+            CarDailyRollup.objects.filter(car_id=pk), ['car_id'], start_date, end_date, interval, {(pk,): 1},
+        )
+        return Response({
+            'car_id': pk,
+            'start_date': start_date,
+            'end_date': end_date,
+            'interval': interval,
+            'periods': [{key: value for key, value in row.items() if key != 'car_id'} for row in report],
+        })
+
+
+class CategoryRollupView(RollupView):
+    def get(self, request):
+        (start_date, end_date), interval = self.get_report_params(request)
+        queryset = CategoryDailyRollup.objects.all()
+        categories = int_list(request, 'category')
+        if categories:
+            queryset = queryset.filter(category_id__in=categories)
+        # Utilization is measured against each category's current fleet size
+        cars = {
+            (category_id,): count
+            for category_id, count in Car.objects.filter(category__isnull=False)
+            .values_list('category_id').annotate(count=Count('pk')).order_by()
+        }
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'interval': interval,
+            'periods': rollup_report(queryset, ['category_id'], start_date, end_date, interval, cars),
+        })